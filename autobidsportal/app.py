@@ -2,22 +2,58 @@
 from __future__ import annotations
 
 import os
+from functools import cached_property
+from typing import TYPE_CHECKING, Any
 
 import flask_excel as excel
-import rq
 from flask import Flask
 from flask_migrate import Migrate
-from redis import Redis
 
 from autobidsportal.email import mail
 from autobidsportal.errors import bad_request, internal_error, not_found_error
 from autobidsportal.models import db, login
 from autobidsportal.routes import portal_blueprint
 
+if TYPE_CHECKING:
+    import rq
+    from redis import Redis
+
+# Connection pool settings used unless overridden by the environment
+DEFAULT_ENGINE_OPTIONS = {
+    "pool_size": 10,
+    "max_overflow": 20,
+    "pool_timeout": 30,
+    "pool_recycle": 3600,
+    "pool_pre_ping": True,
+}
+
+
+class AutobidsFlask(Flask):
+    """Flask application with lazily connected task queue services.
+
+    The redis connection and rq queue are only set up the first time they
+    are accessed, so CLI commands that never enqueue a task skip importing
+    and configuring them.
+    """
+
+    @cached_property
+    def redis(self) -> Redis:
+        """Redis connection used by the task queue and password resets."""
+        from redis import Redis
+
+        return Redis.from_url(self.config["REDIS_URL"], decode_responses=True)
+
+    @cached_property
+    def task_queue(self) -> rq.Queue:
+        """Queue used to defer tasks to the rq workers."""
+        import rq
+
+        return rq.Queue(connection=self.redis)
+
 
 def create_app(
     config_object: str | object | None = None,
-    override_dict: dict[str, str] | None = None,
+    override_dict: dict[str, Any] | None = None,
 ):
     """Application factory for the Autobids Portal.
 
@@ -36,7 +72,7 @@ def create_app(
     Flask
         Flask-application with extensions and options configured
     """
-    app = Flask(__name__)
+    app = AutobidsFlask(__name__)
     # Instantiate a config object
     if config_object is None:
         app.config.from_prefixed_env(prefix="AUTOBIDS")
@@ -47,6 +83,10 @@ def create_app(
         app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = os.environ[
             "SQLALCHEMY_TRACK_MODIFICATIONS"
         ]
+        app.config.setdefault(
+            "SQLALCHEMY_ENGINE_OPTIONS",
+            DEFAULT_ENGINE_OPTIONS.copy(),
+        )
     else:
         app.config.from_object(config_object)
 
@@ -54,6 +94,11 @@ def create_app(
     if override_dict is not None:
         app.config.update(override_dict)
 
+    # Looked up on every PI refresh, so build the set once here
+    app.config["DICOM_PI_BLACKLIST"] = frozenset(
+        app.config.get("DICOM_PI_BLACKLIST") or (),
+    )
+
     # Set app options, update routes and errors
     app.logger.setLevel(app.config["LOG_LEVEL"])
     app.register_blueprint(portal_blueprint, url_prefix="/")
@@ -61,16 +106,14 @@ def create_app(
     app.register_error_handler(404, not_found_error)
     app.register_error_handler(500, internal_error)
 
+    # Slow queries can only be logged if query timings are recorded
+    if app.config.get("SLOW_QUERY_THRESHOLD") is not None:
+        app.config.setdefault("SQLALCHEMY_RECORD_QUERIES", True)
+
     db.init_app(app)  # Init SQLAlchemy instance
     excel.init_excel(app)  # Init flask-excel extension
 
-    # Setup Redis connection + handling of tasks via queue and db operations
-    # (Note: These are specific to this application - not Flask)
-    app.redis = Redis.from_url(  # pyright: ignore
-        app.config["REDIS_URL"],
-        decode_responses=True,
-    )
-    app.task_queue = rq.Queue(connection=app.redis)  # pyright: ignore
+    # Redis connection + task queue are set up lazily by AutobidsFlask
     Migrate(
         app,
         db,
@@ -10,6 +10,54 @@ from os import PathLike
 from pathlib import Path
 
 
+def gen_bind_list(binds: Sequence[str]) -> list[str]:
+    """Convert bind strings to apptainer "-B" arguments.
+
+    Parameters
+    ----------
+    binds
+        List of bind strings of the form src[:dest[:opts]]
+
+    Returns
+    -------
+    list[str]
+        Arguments to pass to apptainer
+    """
+    return list(chain(*[["-B", bind] for bind in binds]))
+
+
+def gen_exec_list(
+    cmd_list: Sequence[str],
+    container_path: PathLike | str,
+    binds: Sequence[str],
+) -> list[str]:
+    """Assemble the arguments for an "apptainer exec" call.
+
+    Parameters
+    ----------
+    cmd_list
+        Command to run in the container.
+
+    container_path
+        Path to the singularity container to be executed.
+
+    binds
+        List of bind strings of the form src[:dest[:opts]]
+
+    Returns
+    -------
+    list[str]
+        Arguments to pass to subprocess
+    """
+    return [
+        "apptainer",
+        "exec",
+        *gen_bind_list(binds),
+        str(container_path),
+        *cmd_list,
+    ]
+
+
 def apptainer_exec(
     cmd_list: Sequence[str],
     container_path: PathLike | str,
@@ -35,22 +83,50 @@ def apptainer_exec(
         overwritten to False and "check" will be overwritten to True, if
         present.
     """
-    bind_list = list(chain(*[["-B", bind] for bind in binds]))
-
     # Overwrite "shell" and "check"
     kwargs["shell"] = False
     if "check" in kwargs:
         del kwargs["check"]
 
     return subprocess.run(
-        ["apptainer", "exec", *bind_list]
-        + [str(container_path)]
-        + list(cmd_list),
+        gen_exec_list(cmd_list, container_path, binds),
         check=True,
         **kwargs,
     )
 
 
+def apptainer_popen(
+    cmd_list: Sequence[str],
+    container_path: PathLike | str,
+    binds: Sequence[str],
+    **kwargs,
+) -> subprocess.Popen:
+    """Start a singularity subprocess with given args without waiting on it.
+
+    Parameters
+    ----------
+    cmd_list
+        Equivalent to "args" in subprocess.Popen. Passed to the singularity
+        container.
+
+    container_path
+        Path to the singularity container to be executed.
+
+    binds
+        List of bind strings of the form src[:dest[:opts]]
+
+    kwargs
+        keyword arguments to be passed to ``subprocess.Popen``. "shell" will
+        be overwritten to False, if present.
+    """
+    kwargs["shell"] = False
+
+    return subprocess.Popen(
+        gen_exec_list(cmd_list, container_path, binds),
+        **kwargs,
+    )
+
+
 @dataclass
 class ImageSpec:
     """A related image location and sequence of binds.
@@ -62,7 +138,79 @@ class ImageSpec:
 
     binds
         List of bind strings of the form src[:dest[:opts]]
+
+    instance
+        Name of a long-lived apptainer instance of the image to run commands
+        in, instead of starting a new container for every command.
     """
 
     image_path: str | Path
     binds: Sequence[str]
+    instance: str | None = None
+
+
+def ensure_instance(image_spec: ImageSpec) -> str:
+    """Start an image spec's apptainer instance if it isn't running.
+
+    The instance is shared by the web app and every worker, so it is left
+    running rather than stopped when any one of them exits.
+
+    Parameters
+    ----------
+    image_spec
+        Image spec with the instance name, image path, and binds to start the
+        instance with.
+
+    Returns
+    -------
+    str
+        Container path to pass to ``apptainer_exec`` to run in the instance.
+
+    Raises
+    ------
+    subprocess.CalledProcessError
+        If the instance can't be listed, or still isn't running after trying
+        to start it. For a failed start, the error holds its captured output.
+    """
+    if image_spec.instance is None:
+        msg = "Image spec has no instance name."
+        raise ValueError(msg)
+
+    if not _instance_running(image_spec.instance):
+        started = subprocess.run(
+            [
+                "apptainer",
+                "instance",
+                "start",
+                *gen_bind_list(image_spec.binds),
+                str(image_spec.image_path),
+                image_spec.instance,
+            ],
+            capture_output=True,
+            text=True,
+            check=False,
+        )
+        # Another process may have started the instance first, so only fail
+        # if it still isn't running
+        if not _instance_running(image_spec.instance):
+            raise subprocess.CalledProcessError(
+                started.returncode or 1,
+                started.args,
+                output=started.stdout,
+                stderr=started.stderr,
+            )
+
+    return f"instance://{image_spec.instance}"
+
+
+def _instance_running(instance: str) -> bool:
+    """Check whether an apptainer instance is running."""
+    return (
+        instance
+        in subprocess.run(
+            ["apptainer", "instance", "list", instance],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.split()
+    )
@@ -10,22 +10,123 @@ natively or in a container).
 from __future__ import annotations
 
 import logging
-import pathlib
-import pipes
+import os
 import re
 import subprocess
 import tempfile
-from collections.abc import Sequence
+from collections import deque
+from collections.abc import Iterable, Sequence
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import date
 from itertools import chain
 from os import PathLike
-from xml.etree.ElementTree import ElementTree
+from xml.etree.ElementTree import Element, iterparse
 
-from defusedxml.ElementTree import parse
 from flask import current_app
 
-from autobidsportal.apptainer import ImageSpec, apptainer_exec
+from autobidsportal.apptainer import (
+    ImageSpec,
+    apptainer_exec,
+    apptainer_popen,
+    ensure_instance,
+)
+
+# Matches the "PI" portion of a "[PI^Project]" StudyDescription in findscu
+# output
+PI_NAME_RE = re.compile(r"\[([\w ]+)\^[\w ]+\]")
+
+# Matches a DICOM tag given as 8 hex digits (e.g. "0020000d")
+TAG_RE = re.compile(r"[\da-fA-F]{8}")
+
+# Matches the tar/uid file name reported by cfmm2tar for each retrieved study
+CFMM2TAR_CREATED_RE = re.compile(r"(?:tar|uid) file created: ([^\r\n]+)")
+
+# Matches the notice the JVM prints when it picks up options from the
+# environment (e.g. "Picked up _JAVA_OPTIONS: -Xmx2048m")
+JVM_OPTIONS_NOTICE_RE = re.compile(r"^Picked up \w+: .*(?:\n|$)", re.MULTILINE)
+
+# Number of trailing cfmm2tar output lines kept for the task log. Every line
+# is still written to the app log as it arrives.
+CFMM2TAR_LOG_TAIL_LINES = 1000
+
+
+def _read_cfmm2tar_output(
+    lines: Iterable[str],
+) -> tuple[list[list[str]], str, bool]:
+    """Parse cfmm2tar's output as it streams in.
+
+    Every line is written to the app log, but only the last
+    CFMM2TAR_LOG_TAIL_LINES are kept in memory for the returned log.
+
+    Parameters
+    ----------
+    lines
+        Lines of cfmm2tar's combined stdout and stderr
+
+    Returns
+    -------
+    tuple[list[list[str]], str, bool]
+        The tar and uid file names created for each retrieved study, the
+        tail of the output, and whether cfmm2tar reported a timeout.
+    """
+    tar_files = []
+    log_tail = deque(maxlen=CFMM2TAR_LOG_TAIL_LINES)
+    line_count = 0
+    timed_out = False
+    for line in lines:
+        log_tail.append(line)
+        line_count += 1
+        current_app.logger.info("cfmm2tar: %s", line.rstrip())
+        timed_out = timed_out or "Timeout.java" in line
+        if "Retrieving #" in line:
+            tar_files.append([])
+        if tar_files:
+            tar_files[-1].extend(CFMM2TAR_CREATED_RE.findall(line))
+    if line_count > len(log_tail):
+        log_tail.appendleft(
+            f"[{line_count - len(log_tail)} earlier lines omitted]\n",
+        )
+    return tar_files, "".join(log_tail), timed_out
+
+
+def _dicom_date(value: date | None) -> str:
+    """Format a date as a DICOM DA value, or an open range bound if unset."""
+    return f"{value:%Y%m%d}" if value is not None else ""
+
+
+def _gen_match_keys(attributes: DicomQueryAttributes) -> list[str]:
+    """Generate the findscu match keys ("-m" values) for a DICOM query."""
+    keys = []
+    if attributes.study_description is not None:
+        keys.append(f"StudyDescription={attributes.study_description}")
+
+    if attributes.study_date is not None:
+        keys.append(f"StudyDate={_dicom_date(attributes.study_date)}")
+    elif (attributes.date_range_start is not None) or (
+        attributes.date_range_end is not None
+    ):
+        start = _dicom_date(attributes.date_range_start)
+        end = _dicom_date(attributes.date_range_end)
+        keys.append(f"StudyDate={start}-{end}")
+
+    if attributes.patient_name is not None:
+        keys.append(f"PatientName={attributes.patient_name}")
+
+    # findscu keeps only the last value given for a key, so multiple UIDs
+    # must be passed as one multi-valued match
+    if attributes.study_instance_uids:
+        uids = "\\\\".join(attributes.study_instance_uids)
+        keys.append(f"StudyInstanceUID={uids}")
+    elif current_app.config["DICOM_SERVER_STUDYINSTANCEUID_WILDCARD"]:
+        keys.append("StudyInstanceUID=*")
+
+    return keys
+
+
+def _opt(flag: str, val: str | None) -> tuple[str, ...]:
+    """Render an optional command line flag, omitting it if unset."""
+    return (flag, val) if val is not None else ()
 
 
 @dataclass
@@ -81,15 +182,13 @@ class DicomQueryAttributes:
 
     def __post_init__(self):
         """Check invariants of the args."""
-        if all(
-            [
-                self.study_description is None,
-                self.study_date is None,
-                self.patient_name is None,
-                self.study_instance_uids in [None, []],
-                self.date_range_start is None,
-                self.date_range_end is None,
-            ],
+        if (
+            self.study_description is None
+            and self.study_date is None
+            and self.patient_name is None
+            and not self.study_instance_uids
+            and self.date_range_start is None
+            and self.date_range_end is None
         ):
             msg = (
                 "You must specify at least one of study_description, study_date, or "
@@ -180,78 +279,126 @@ class Tar2bidsArgs:
     deface: bool = False
 
 
-def parse_findscu_xml(
-    element_tree: ElementTree,
+def normalize_output_fields(output_fields: Sequence[str]) -> list[str]:
+    """Normalize output fields to match the tags in findscu output XML.
+
+    Parameters
+    ----------
+    output_fields
+        List of output fields (DICOM tags or keywords) passed to findscu
+
+    Returns
+    -------
+    list[str]
+        The output fields, with hex tags converted to upper case
+    """
+    return [
+        field.upper() if TAG_RE.fullmatch(field) else field
+        for field in output_fields
+    ]
+
+
+def _read_attribute(attribute: Element) -> str:
+    """Get the value of one findscu output attribute.
+
+    Parameters
+    ----------
+    attribute
+        A DicomAttribute element from findscu output XML.
+
+    Raises
+    ------
+    Dcm4cheError
+        If a PN attribute has no name components
+    """
+    if attribute.attrib["vr"] == "PN":
+        # Only the first name component with text is needed
+        value = next(
+            (
+                element.text
+                for element in attribute.iter()
+                if element is not attribute and element.text is not None
+            ),
+            None,
+        )
+        if value is None:
+            msg = f"Found PN attribute with no text: {attribute}"
+            raise Dcm4cheError(
+                msg,
+            )
+        return value
+
+    return (
+        value_attr.text
+        if (value_attr := attribute.find("./Value")) is not None
+        else ""
+    )
+
+
+def parse_findscu_file(
+    path: PathLike[str] | str,
     output_fields: Sequence[str],
-) -> list[dict[str, str]]:
-    """Find the relevant output from findscu output XML.
+) -> dict[str, str]:
+    """Find the relevant output from a findscu output XML file.
+
+    The file is parsed incrementally, each top-level attribute is discarded
+    once it has been read, and parsing stops as soon as every output field
+    has been found.
 
     Parameters
     ----------
-    element_tree
-        One XML document produced by findscu.
+    path
+        Path to one XML document produced by findscu.
 
     output_fields
-        List of output fields we're interested in (passed to findscu)
+        List of output fields we're interested in, as normalized by
+        normalize_output_fields
+
+    Returns
+    -------
+    dict[str, str]
+        The value of each output field, keyed by its DICOM keyword (e.g.
+        PatientName), in the order of output_fields.
 
     Raises
     ------
     Dcm4cheError
         If dcm4che fails for any reason
     """
-    output_fields = [
-        f"{field[:8]}".upper()
-        if re.fullmatch(r"[\dabcdefABCDEF]{8}", field)
-        else field
-        for field in output_fields
-    ]
-    out_list = []
+    wanted = set(output_fields)
+    found = {}
+    depth = 0
+    with open(path, "rb") as xml_file:
+        # S314: this is findscu output we generate ourselves, not untrusted XML
+        events = iterparse(xml_file, events=("start", "end"))  # noqa: S314
+        for event, element in events:
+            if event == "start":
+                depth += 1
+                continue
+            depth -= 1
+            # Only look at direct children of the root, not nested sequences
+            if depth != 1 or element.tag != "DicomAttribute":
+                continue
+            # Tags and keywords can't collide, so at most one of these is
+            # wanted. The first matching attribute wins.
+            for field in (element.get("tag"), element.get("keyword")):
+                if field in wanted and field not in found:
+                    found[field] = (
+                        element.attrib["keyword"],
+                        _read_attribute(element),
+                    )
+            element.clear()
+            if len(found) == len(wanted):
+                break
+
     for field in output_fields:
-        attribute_by_tag = element_tree.getroot().find(
-            f"./DicomAttribute[@tag='{field}']",
-        )
-        attribute_by_keyword = element_tree.getroot().find(
-            f"./DicomAttribute[@keyword='{field}']",
-        )
-        attribute = (
-            attribute_by_tag
-            if attribute_by_tag is not None
-            else attribute_by_keyword
-        )
-        if attribute is None:
+        if field not in found:
             msg = f"Missing expected output field {field} in findscu output"
             raise Dcm4cheError(
                 msg,
             )
 
-        tag_code = attribute.attrib["tag"]
-        out_dict = {
-            "tag_code": f"{tag_code[0:4]},{tag_code[4:8]}",
-            "tag_name": attribute.attrib["keyword"],
-        }
-        if attribute.attrib["vr"] == "PN":
-            value_elements = [
-                element
-                for element in attribute.findall(".//*")
-                if element.text is not None
-            ]
-            if not value_elements:
-                msg = f"Found PN attribute with no text: {attribute}"
-                raise Dcm4cheError(
-                    msg,
-                )
-            value = value_elements[0].text
-        else:
-            value = (
-                value_attr.text
-                if (value_attr := attribute.find("./Value")) is not None
-                else ""
-            )
-
-        out_dict["tag_value"] = value
-        out_list.append(out_dict)
-
-    return out_list
+    return dict(found[field] for field in output_fields)
 
 
 class Dcm4cheUtils:
@@ -286,8 +433,9 @@ class Dcm4cheUtils:
         self.password = credentials.password
         self.cfmm2tar_spec = cfmm2tar_spec
         self.tar2bids_spec = tar2bids_spec
+        self._cfmm2tar_instance = None
 
-        self._findscu_list = [
+        self._findscu_list = (
             "findscu",
             "--bind",
             "DEFAULT",
@@ -296,35 +444,113 @@ class Dcm4cheUtils:
             "--accept-timeout",
             "10000",
             "--user",
-            f"{pipes.quote(self.username)}",
+            self.username,
             "--user-pass",
-            f"{self.password}",
-        ]
-
-        if connection_details.use_tls:
-            self._findscu_list.append("--tls-aes")
+            self.password,
+            *(("--tls-aes",) if connection_details.use_tls else ()),
+        )
 
     def exec_cfmm2tar(
         self,
         cmd_list: Sequence[str],
+        *,
+        discard_stdout: bool = False,
     ) -> subprocess.CompletedProcess:
         """Execute the cfmm2tar container with the configured setup.
 
+        If the cfmm2tar spec names an instance, the command is run in that
+        (long-lived) instance to avoid paying container startup per call.
+
         Parameters
         ----------
         cmd_list
             Equivalent to "args" in subprocess.run. Passed to the singularity
             container.
 
+        discard_stdout
+            Send stdout to /dev/null instead of capturing it, for commands
+            that write their results to files. stderr is still captured.
+
+        Raises
+        ------
+        Dcm4cheError
+            If the configured instance isn't running and can't be started.
         """
-        return apptainer_exec(
+        container_path, binds = self._cfmm2tar_container()
+        try:
+            return apptainer_exec(
+                cmd_list,
+                container_path,
+                binds,
+                stdout=subprocess.DEVNULL
+                if discard_stdout
+                else subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+            )
+        except subprocess.CalledProcessError:
+            # Check the instance is still running on the next call
+            self._cfmm2tar_instance = None
+            raise
+
+    def popen_cfmm2tar(self, cmd_list: Sequence[str]) -> subprocess.Popen:
+        """Start the cfmm2tar container, streaming its combined output.
+
+        Parameters
+        ----------
+        cmd_list
+            Equivalent to "args" in subprocess.Popen. Passed to the
+            singularity container.
+
+        Returns
+        -------
+        subprocess.Popen
+            The running process, with stderr merged into a line-buffered text
+            stdout.
+
+        Raises
+        ------
+        Cfmm2tarError
+            If the configured instance isn't running and can't be started.
+        """
+        try:
+            container_path, binds = self._cfmm2tar_container()
+        except Dcm4cheError as error:
+            raise Cfmm2tarError(str(error)) from error
+        return apptainer_popen(
             cmd_list,
-            self.cfmm2tar_spec.image_path,
-            self.cfmm2tar_spec.binds,
-            capture_output=True,
+            container_path,
+            binds,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
             text=True,
+            bufsize=1,
         )
 
+    def _cfmm2tar_container(self) -> tuple[str | PathLike[str], Sequence[str]]:
+        """Get the container path and binds to run cfmm2tar commands with.
+
+        Raises
+        ------
+        Dcm4cheError
+            If the configured instance isn't running and can't be started.
+        """
+        if self.cfmm2tar_spec.instance is None:
+            return self.cfmm2tar_spec.image_path, self.cfmm2tar_spec.binds
+        if self._cfmm2tar_instance is None:
+            try:
+                self._cfmm2tar_instance = ensure_instance(self.cfmm2tar_spec)
+            except (subprocess.CalledProcessError, OSError) as error:
+                stderr = getattr(error, "stderr", None) or error
+                current_app.logger.error(
+                    "Could not start the cfmm2tar instance: %s",
+                    stderr,
+                )
+                msg = f"Could not start the cfmm2tar instance:\n{stderr}"
+                raise Dcm4cheError(msg) from error
+        # Binds were applied when the instance was started
+        return self._cfmm2tar_instance, []
+
     def get_all_pi_names(self) -> list[str]:
         """Find all PIs the user has access to (by StudyDescription).
 
@@ -347,23 +573,17 @@ class Dcm4cheUtils:
             )
             msg = "Non-zero exit status from findscu."
             raise Dcm4cheError(msg) from error
-        err = completed_proc.stderr
-        if err and err != "Picked up _JAVA_OPTIONS: -Xmx2048m\n":
+        if err := JVM_OPTIONS_NOTICE_RE.sub("", completed_proc.stderr):
             self.logger.error(err)
 
-        dcm4che_out = completed_proc.stdout.splitlines()
-        study_descriptions = [
-            line for line in dcm4che_out if "StudyDescription" in line
-        ]
-        pi_matches = [
-            re.match(r".*\[([\w ]+)\^[\w ]+\].*", line)
-            for line in study_descriptions
-        ]
-        pis = [match.group(1) for match in pi_matches if match is not None]
-
-        all_pis = list(
-            set(pis) - set(current_app.config["DICOM_PI_BLACKLIST"]),
-        )
+        pis = {
+            match.group(1)
+            for line in completed_proc.stdout.splitlines()
+            if "StudyDescription" in line
+            and (match := PI_NAME_RE.search(line)) is not None
+        }
+        pis.difference_update(current_app.config["DICOM_PI_BLACKLIST"])
+        all_pis = list(pis)
 
         if len(all_pis) < 1:
             current_app.logger.error("findscu completed but no PIs found.")
@@ -377,7 +597,7 @@ class Dcm4cheUtils:
         output_fields: Sequence[str],
         attributes: DicomQueryAttributes,
         retrieve_level: str = "STUDY",
-    ) -> list[list[dict[str, str]]]:
+    ) -> list[dict[str, str]]:
         """Query a DICOM server for specified tags from one study.
 
         Parameters
@@ -395,78 +615,38 @@ class Dcm4cheUtils:
 
         Returns
         -------
-        list[list[dict[str, str]]]
-            A list containing one value for each result, where each result
-            contains a list of dicts, where each dict contains the code, name,
-            and value of each requested tag.
+        list[dict[str, str]]
+            A list containing one dict for each result, mapping the keyword
+            of each requested tag (e.g. PatientName) to its value.
 
         Raises
         ------
         Dcm4cheError
             If dcm4che fails for any reason.
         """
-        cmd = self._findscu_list.copy()
-
-        if attributes.study_description is not None:
-            cmd.extend(
-                [
-                    "-m",
-                    f"StudyDescription={attributes.study_description}",
-                ],
-            )
-
-        if attributes.study_date is not None:
-            cmd.extend(
-                [
-                    "-m",
-                    f'StudyDate={attributes.study_date.strftime("%Y%m%d")}',
-                ],
-            )
-        elif (attributes.date_range_start is not None) or (
-            attributes.date_range_end is not None
-        ):
-            start = (
-                attributes.date_range_start.strftime("%Y%m%d")
-                if attributes.date_range_start is not None
-                else ""
-            )
-            end = (
-                attributes.date_range_end.strftime("%Y%m%d")
-                if attributes.date_range_end is not None
-                else ""
-            )
-            cmd.extend(["-m", f"StudyDate={start}-{end}"])
-
-        if attributes.patient_name is not None:
-            cmd.extend(["-m", f"PatientName={attributes.patient_name}"])
-
-        if attributes.study_instance_uids not in [None, []]:
-            cmd.extend(
-                [
-                    "-m",
-                    "StudyInstanceUID={}".format(
-                        "\\\\".join(
-                            attributes.study_instance_uids,  # pyright: ignore
-                        ),  # Typecheck since join always expects input
-                    ),
-                ],
-            )
-        elif current_app.config["DICOM_SERVER_STUDYINSTANCEUID_WILDCARD"]:
-            cmd.extend(["-m", "StudyInstanceUID=*"])
-
-        cmd.extend(
-            list(chain(*[["-r", f"{field}"] for field in output_fields])),
-        )
-        cmd.extend(["-L", f"{retrieve_level}"])
+        # Normalized once per query, not once per result
+        normalized_fields = normalize_output_fields(output_fields)
 
         with tempfile.TemporaryDirectory() as tmpdir:
-            cmd.extend(
-                ["--out-dir", f"{tmpdir}", "--out-file", "000.xml", "-X"],
-            )
+            cmd = [
+                *self._findscu_list,
+                *chain.from_iterable(
+                    ("-m", key) for key in _gen_match_keys(attributes)
+                ),
+                *chain.from_iterable(("-r", field) for field in output_fields),
+                "-L",
+                retrieve_level,
+                "--out-dir",
+                tmpdir,
+                "--out-file",
+                "000.xml",
+                "-X",
+            ]
 
             current_app.logger.info("Querying study with findscu.")
             try:
-                completed_proc = self.exec_cfmm2tar(cmd)
+                # Results go to tmpdir, so don't buffer the stdout dump
+                completed_proc = self.exec_cfmm2tar(cmd, discard_stdout=True)
             except subprocess.CalledProcessError as error:
                 current_app.logger.error(
                     "Findscu failed while querying study.",
@@ -476,15 +656,65 @@ class Dcm4cheUtils:
                     msg,
                 ) from error
 
-            trees_xml = [
-                parse(child) for child in pathlib.Path(tmpdir).iterdir()
-            ]
+            if err := JVM_OPTIONS_NOTICE_RE.sub("", completed_proc.stderr):
+                self.logger.error(err)
 
-        err = completed_proc.stderr
-        if err and err != "Picked up _JAVA_OPTIONS: -Xmx2048m\n":
-            self.logger.error(err)
+            with os.scandir(tmpdir) as entries:
+                return [
+                    parse_findscu_file(entry.path, normalized_fields)
+                    for entry in entries
+                    if entry.is_file()
+                ]
 
-        return [parse_findscu_xml(tree, output_fields) for tree in trees_xml]
+    def query_many_studies(
+        self,
+        output_fields: Sequence[str],
+        attributes_list: Sequence[DicomQueryAttributes],
+        retrieve_level: str = "STUDY",
+    ) -> list[list[dict[str, str]]]:
+        """Run several independent findscu queries concurrently.
+
+        Each query runs in its own subprocess, so they are dispatched over a
+        thread pool sized by the DICOM_PARALLELISM config var (default 4).
+
+        Parameters
+        ----------
+        output_fields
+            A list of DICOM tags to query (e.g. PatientName). Passed to
+            `findscu -r {}`.
+
+        attributes_list
+            One set of attributes to search for per query.
+
+        retrieve_level
+            Level at which to retrieve records. Defaults to "STUDY", but can
+            also be "PATIENT", "SERIES", or "IMAGE".
+
+        Returns
+        -------
+        list[list[dict[str, str]]]
+            The result of query_single_study for each set of attributes, in
+            the same order as attributes_list.
+
+        Raises
+        ------
+        Dcm4cheError
+            If dcm4che fails for any of the queries.
+        """
+        app = current_app._get_current_object()  # noqa: SLF001
+
+        def query(attributes: DicomQueryAttributes):
+            with app.app_context():
+                return self.query_single_study(
+                    output_fields,
+                    attributes,
+                    retrieve_level=retrieve_level,
+                )
+
+        with ThreadPoolExecutor(
+            max_workers=current_app.config.get("DICOM_PARALLELISM", 4),
+        ) as executor:
+            return list(executor.map(query, attributes_list))
 
     def run_cfmm2tar(
         self,
@@ -527,67 +757,48 @@ class Dcm4cheUtils:
                 msg,
             )
 
-        uid_query = [
-            "-u",
-            args.study_instance_uid
-            if args.study_instance_uid is not None
-            else [],
-        ]
-        project_query = (
-            ["-p", args.project] if args.project is not None else []
-        )
-
         with tempfile.NamedTemporaryFile(mode="w+", buffering=1) as cred_file:
             cred_file.write(self.username + "\n")
             cred_file.write(self.password + "\n")
-            arg_list = (
-                ["cfmm2tar"]
-                + ["-c", cred_file.name]
-                + uid_query
-                + (["-d", args.date_str] if args.date_str is not None else [])
-                + (
-                    ["-n", args.patient_name]
-                    if args.patient_name is not None
-                    else []
-                )
-                + project_query
-                + ["-s", current_app.config["DICOM_SERVER_URL"]]
-                + [str(args.out_dir)]
-            )
+            arg_list = [
+                "cfmm2tar",
+                "-c",
+                cred_file.name,
+                *_opt("-u", args.study_instance_uid),
+                *_opt("-d", args.date_str),
+                *_opt("-n", args.patient_name),
+                *_opt("-p", args.project),
+                "-s",
+                current_app.config["DICOM_SERVER_URL"],
+                str(args.out_dir),
+            ]
 
             current_app.logger.info("Running cfmm2tar: %s", " ".join(arg_list))
-            try:
-                out = self.exec_cfmm2tar(arg_list)
-            except subprocess.CalledProcessError as err:
-                if "Timeout.java" in err.stderr:
-                    current_app.logger.warning("cfmm2tar timed out.")
-                    raise Cfmm2tarTimeoutError from err
-                current_app.logger.error("cfmm2tar failed: %s", err.stderr)
-                msg = f"Cfmm2tar failed:\n{err.stderr}"
-                raise Cfmm2tarError(msg) from err
-
-            all_out = out.stdout + out.stderr
-            split_out = all_out.split("Retrieving #")[1:]
-
-            current_app.logger.info("cfmm2tar stdout: %s", out.stdout)
-            current_app.logger.info("cfmm2tar stderr: %s", out.stderr)
-
-            tar_files = [
-                [
-                    line.split("created: ")[1]
-                    for line in file_out.splitlines()
-                    if any(
-                        [
-                            "tar file created" in line,
-                            "uid file created" in line,
-                        ],
+            # Parse the output as it arrives rather than buffering stdout and
+            # stderr separately and splitting them afterwards
+            with self.popen_cfmm2tar(arg_list) as proc:
+                try:
+                    tar_files, all_out, timed_out = _read_cfmm2tar_output(
+                        proc.stdout,  # pyright: ignore
                     )
-                ]
-                for file_out in split_out
-            ]
+                except BaseException:
+                    # Otherwise leaving the block waits for cfmm2tar to finish
+                    proc.kill()
+                    raise
+
+            if proc.returncode != 0:
+                # Check the instance is still running on the next call
+                self._cfmm2tar_instance = None
+                if timed_out:
+                    current_app.logger.warning("cfmm2tar timed out.")
+                    raise Cfmm2tarTimeoutError
+                current_app.logger.error("cfmm2tar failed: %s", all_out)
+                msg = f"Cfmm2tar failed:\n{all_out}"
+                raise Cfmm2tarError(msg)
+
             if tar_files == []:
                 current_app.logger.warning("No tar files found for cfmm2tar.")
-                if "Timeout.java" in all_out:
+                if timed_out:
                     current_app.logger.warning("cfmm2tar timed out.")
                     raise Cfmm2tarTimeoutError
 
@@ -611,20 +822,17 @@ class Dcm4cheUtils:
         Tar2bidsError
             If Tar2bids fails for any reason.
         """
-        arg_list = (
-            ["/opt/tar2bids/tar2bids"]
-            + (
-                ["-P", args.patient_str]
-                if args.patient_str is not None
-                else []
-            )
-            + (["-o", args.output_dir])
-            + (["-h", args.heuristic] if args.heuristic is not None else [])
-            + (["-w", args.temp_dir] if args.temp_dir is not None else [])
-            + (["-b", args.bidsignore] if args.bidsignore is not None else [])
-            + (["-D"] if args.deface else [])
-            + list(args.tar_files)
-        )
+        arg_list = [
+            "/opt/tar2bids/tar2bids",
+            *_opt("-P", args.patient_str),
+            "-o",
+            args.output_dir,
+            *_opt("-h", args.heuristic),
+            *_opt("-w", args.temp_dir),
+            *_opt("-b", args.bidsignore),
+            *(("-D",) if args.deface else ()),
+            *args.tar_files,
+        ]
 
         current_app.logger.info("Running tar2bids.")
         try:
@@ -645,14 +853,20 @@ class Dcm4cheUtils:
 
 
 def gen_utils() -> Dcm4cheUtils:
-    """Generate a Dcm4cheUtils with values from the current_app config.
+    """Get a Dcm4cheUtils with values from the current_app config.
+
+    The utils only depend on the app config, so one instance is built per
+    app and reused on subsequent calls.
 
     Returns
     -------
     Dcm4cheUtils
         Utilites for interacting via dcm4che
     """
-    return Dcm4cheUtils(
+    if (utils := current_app.extensions.get("dcm4che_utils")) is not None:
+        return utils
+
+    utils = Dcm4cheUtils(
         DicomConnectionDetails(
             connect=current_app.config["DICOM_SERVER_URL"],
             use_tls=current_app.config["DICOM_SERVER_TLS"],
@@ -664,12 +878,15 @@ def gen_utils() -> Dcm4cheUtils:
         ImageSpec(
             current_app.config["CFMM2TAR_PATH"],
             current_app.config["CFMM2TAR_BINDS"].split(","),
+            instance=current_app.config.get("CFMM2TAR_INSTANCE") or None,
         ),
         ImageSpec(
             current_app.config["TAR2BIDS_PATH"],
             current_app.config["TAR2BIDS_BINDS"].split(","),
         ),
     )
+    # Threads may race to build the utils, so keep whichever was stored first
+    return current_app.extensions.setdefault("dcm4che_utils", utils)
 
 
 class Dcm4cheError(Exception):
@@ -3,9 +3,14 @@ from __future__ import annotations
 
 import re
 from collections.abc import Sequence
+from dataclasses import asdict
 from datetime import date
+from hashlib import sha256
+from json import dumps, loads
 from typing import Any
 
+from flask import current_app
+
 from autobidsportal.dcm4cheutils import DicomQueryAttributes, gen_utils
 from autobidsportal.models import Study
 
@@ -19,6 +24,107 @@ ATTRIBUTES_QUERIED = [
     "00100040",  # PatientSex
 ]
 
+# Prefix of the redis keys holding cached DICOM query responses
+DICOM_CACHE_PREFIX = "dicom_responses:"
+
+
+def _cache_key(attributes: DicomQueryAttributes) -> str:
+    """Build the redis key for a DICOM query's cached responses."""
+    fields = asdict(attributes)
+    if fields["study_instance_uids"]:
+        fields["study_instance_uids"] = sorted(fields["study_instance_uids"])
+    query = dumps([ATTRIBUTES_QUERIED, fields], sort_keys=True, default=str)
+    digest = sha256(query.encode()).hexdigest()
+    return f"{DICOM_CACHE_PREFIX}{digest}"
+
+
+def query_series(
+    attributes_list: Sequence[DicomQueryAttributes],
+) -> list[list[dict[str, str]]]:
+    """Query the DICOM server for series, reusing recent responses.
+
+    Responses are kept in redis for DICOM_CACHE_TIMEOUT seconds (default
+    180), or until cfmm2tar records a new download, so loading the DICOM
+    page and then launching cfmm2tar doesn't query the server twice. Only
+    the raw responses are cached, so changes to a study's exclusions or
+    patient name filter apply immediately. If redis is unavailable, the
+    server is queried directly.
+
+    Parameters
+    ----------
+    attributes_list
+        One set of attributes to search for per query.
+
+    Returns
+    -------
+    list[list[dict[str, str]]]
+        The flat series responses for each set of attributes, in the same
+        order as attributes_list.
+    """
+    from redis.exceptions import RedisError
+
+    timeout = current_app.config.get("DICOM_CACHE_TIMEOUT", 180)
+    keys = [_cache_key(attributes) for attributes in attributes_list]
+    cached = [None] * len(keys)
+    if timeout:
+        try:
+            cached = current_app.redis.mget(keys)  # pyright: ignore
+        except RedisError:
+            current_app.logger.warning("Could not read cached DICOM records")
+            timeout = 0
+
+    missing = [index for index, value in enumerate(cached) if value is None]
+    if len(missing) == 1:
+        fetched = [
+            gen_utils().query_single_study(
+                ATTRIBUTES_QUERIED,
+                attributes_list[missing[0]],
+                retrieve_level="SERIES",
+            ),
+        ]
+    elif missing:
+        fetched = gen_utils().query_many_studies(
+            ATTRIBUTES_QUERIED,
+            [attributes_list[index] for index in missing],
+            retrieve_level="SERIES",
+        )
+    else:
+        fetched = []
+
+    if fetched and timeout:
+        try:
+            pipe = current_app.redis.pipeline()  # pyright: ignore
+            for index, responses in zip(missing, fetched):
+                pipe.setex(keys[index], timeout, dumps(responses))
+            pipe.execute()
+        except RedisError:
+            current_app.logger.warning("Could not cache DICOM records")
+
+    results = [None if value is None else loads(value) for value in cached]
+    for index, responses in zip(missing, fetched):
+        results[index] = responses
+    return results
+
+
+def clear_cached_responses():
+    """Drop every cached DICOM query response.
+
+    Called once cfmm2tar has recorded a new download, so the next query sees
+    the server's current series instead of responses from before it.
+    """
+    from redis.exceptions import RedisError
+
+    try:
+        keys = list(
+            current_app.redis.scan_iter(  # pyright: ignore
+                match=f"{DICOM_CACHE_PREFIX}*",
+            ),
+        )
+        if keys:
+            current_app.redis.delete(*keys)  # pyright: ignore
+    except RedisError:
+        current_app.logger.warning("Could not clear cached DICOM records")
+
 
 def get_inclusion_records(
     uids_included: Sequence[str],
@@ -39,24 +145,11 @@ def get_inclusion_records(
     """
     if not uids_included:
         return []
-    responses_flat = rearrange_response(
-        gen_utils().query_single_study(
-            ATTRIBUTES_QUERIED,
-            DicomQueryAttributes(study_instance_uids=uids_included),
-            retrieve_level="SERIES",
-        ),
+    return organize_inclusion_responses(
+        query_series(
+            [DicomQueryAttributes(study_instance_uids=uids_included)],
+        )[0],
     )
-    patient_info = {
-        (
-            response["PatientID"],
-            response["PatientName"],
-            response["PatientSex"],
-            response["StudyID"],
-            response["StudyInstanceUID"],
-        )
-        for response in responses_flat
-    }
-    return organize_flat_responses(responses_flat, patient_info)
 
 
 def get_description_records(
@@ -81,52 +174,9 @@ def get_description_records(
         A list of dictionaries with patient-level attributes and a
         list of sub-dictionaries with study-level attributes.
     """
-    uids_excluded = [
-        explicit_patient.study_instance_uid
-        for explicit_patient in study.explicit_patients  # pyright: ignore
-        if not explicit_patient.included
-    ]
-    if (date is None) and study.retrospective_data:
-        start = study.retrospective_start
-        end = study.retrospective_end
-    else:
-        start = None
-        end = None
-    responses_description = rearrange_response(
-        gen_utils().query_single_study(
-            ATTRIBUTES_QUERIED,
-            DicomQueryAttributes(
-                study_description=description,
-                study_date=date,
-                date_range_start=start,
-                date_range_end=end,
-                patient_name=study.patient_str,
-            ),
-            retrieve_level="SERIES",
-        ),
-    )
-    patient_info_description = {
-        (
-            response["PatientID"],
-            response["PatientName"],
-            response["PatientSex"],
-            response["StudyID"],
-            response["StudyInstanceUID"],
-        )
-        for response in responses_description
-        if re.fullmatch(
-            (
-                study.patient_name_re
-                if study.patient_name_re is not None
-                else ".*"
-            ),
-            response["PatientName"],
-        )
-        and (response["StudyInstanceUID"] not in uids_excluded)
-    }
-    return organize_flat_responses(
-        responses_description,
-        patient_info_description,
+    return organize_description_responses(
+        study,
+        query_series([gen_description_query(study, date, description)])[0],
     )
 
 
@@ -160,8 +210,25 @@ def get_study_records(
         for explicit_patient in study.explicit_patients  # pyright: ignore
         if explicit_patient.included
     }
-    inclusion_records = get_inclusion_records(list(uids_included))
-    description_records = get_description_records(study, date, description)
+    if not uids_included:
+        return get_description_records(study, date, description)
+
+    # The two searches use different match keys, and findscu applies its -m
+    # keys to the whole invocation, so they can't share one findscu process.
+    # query_series runs them concurrently instead. Only the queries leave
+    # this thread, so the study is never touched outside its session's
+    # thread.
+    responses_inclusion, responses_description = query_series(
+        [
+            DicomQueryAttributes(study_instance_uids=list(uids_included)),
+            gen_description_query(study, date, description),
+        ],
+    )
+    inclusion_records = organize_inclusion_responses(responses_inclusion)
+    description_records = organize_description_responses(
+        study,
+        responses_description,
+    )
 
     return inclusion_records + [
         record
@@ -170,34 +237,128 @@ def get_study_records(
     ]
 
 
-def rearrange_response(
-    dicom_response: Sequence[Sequence[dict[str, str]]],
-) -> list[dict[str, str]]:
-    """Rearrange a list of lists of dicts from dcm4cheutils.
+def gen_description_query(
+    study: Study,
+    date: date | None = None,
+    description: str | None = None,
+) -> DicomQueryAttributes:
+    """Generate the DICOM query matching a study's search parameters.
+
+    Parameters
+    ----------
+    study
+        Study to take parameters from.
+    date
+        Date to grab studies from.
+    description
+        "{PI Name}^{Study Name}", StudyDescription to query.
+
+    Returns
+    -------
+    DicomQueryAttributes
+        Attributes to pass to the DICOM query.
+    """
+    if (date is None) and study.retrospective_data:
+        start = study.retrospective_start
+        end = study.retrospective_end
+    else:
+        start = None
+        end = None
+    return DicomQueryAttributes(
+        study_description=description,
+        study_date=date,
+        date_range_start=start,
+        date_range_end=end,
+        patient_name=study.patient_str,
+    )
+
+
+def organize_inclusion_responses(
+    responses: Sequence[dict[str, str]],
+) -> list[dict[str, Any]]:
+    """Organize the responses to a query for included StudyInstanceUIDs.
 
     Parameters
     ----------
-    dicom_response
-        DICOM query response from dcm4cheutils.
+    responses
+        Flat responses corresponding to every series
 
     Returns
     -------
-    list[dict[str, str]]
-        Rearranged DICOM query response where each dict's key is an attribute
-        and its corresponding value is the value of that attribute.
+    list[dict[str, Any]]
+        A list of dictionaries with patient-level attributes and a
+        list of sub-dictionaries with study-level attributes.
     """
-    return [
-        {
-            attribute["tag_name"]: attribute["tag_value"]
-            for attribute in response
-        }
-        for response in dicom_response
-    ]
+    # Keep the first series seen for each study, as for description searches
+    patient_info = {}
+    for response in responses:
+        patient_info.setdefault(
+            response["StudyInstanceUID"],
+            (
+                response["PatientID"],
+                response["PatientName"],
+                response["PatientSex"],
+                response["StudyID"],
+            ),
+        )
+    return organize_flat_responses(responses, patient_info)
+
+
+def organize_description_responses(
+    study: Study,
+    responses: Sequence[dict[str, str]],
+) -> list[dict[str, Any]]:
+    """Organize the responses to a study's search, dropping unwanted studies.
+
+    Parameters
+    ----------
+    study
+        Study whose patient name filter and excluded patients to apply.
+    responses
+        Flat responses corresponding to every series
+
+    Returns
+    -------
+    list[dict[str, Any]]
+        A list of dictionaries with patient-level attributes and a
+        list of sub-dictionaries with study-level attributes.
+    """
+    uids_excluded = {
+        explicit_patient.study_instance_uid
+        for explicit_patient in study.explicit_patients  # pyright: ignore
+        if not explicit_patient.included
+    }
+    patient_name_re = re.compile(
+        study.patient_name_re if study.patient_name_re is not None else ".*",
+    )
+    # Every series of a study repeats its patient name, so only check each
+    # name once
+    name_matches = {}
+    patient_info_description = {}
+    for response in responses:
+        study_uid = response["StudyInstanceUID"]
+        if (study_uid in uids_excluded) or (
+            study_uid in patient_info_description
+        ):
+            continue
+        patient_name = response["PatientName"]
+        if patient_name not in name_matches:
+            name_matches[patient_name] = (
+                patient_name_re.fullmatch(patient_name) is not None
+            )
+        if name_matches[patient_name]:
+            patient_info_description[study_uid] = (
+                response["PatientID"],
+                patient_name,
+                response["PatientSex"],
+                response["StudyID"],
+            )
+    return organize_flat_responses(responses, patient_info_description)
 
 
 def organize_flat_responses(
     responses: Sequence[dict[str, str]],
-    patient_info: set[tuple[str, str, str, str, str]],
+    patient_info: dict[str, tuple[str, str, str, str]],
 ) -> list[dict[str, Any]]:
     """Organize a flat list of DICOM responses to a hierarchical structure.
 
@@ -207,7 +368,8 @@ def organize_flat_responses(
         Flat responses corresponding to every series
 
     patient_info
-        Tuple of patient info for every StudyInstanceUID in the response.
+        Tuple of (PatientID, PatientName, PatientSex, StudyID) for each
+        StudyInstanceUID to include in the output.
 
     Returns
     -------
@@ -215,6 +377,19 @@ def organize_flat_responses(
         A list of dictionaries with patient-level attributes and a
         list of sub-dictionaries with study-level attributes.
     """
+    # Bucket the series by study once rather than rescanning every response
+    # for each study
+    series_by_uid = {}
+    for response in responses:
+        if response["StudyInstanceUID"] not in patient_info:
+            continue
+        series_by_uid.setdefault(response["StudyInstanceUID"], []).append(
+            {
+                "SeriesNumber": response["SeriesNumber"],
+                "SeriesDescription": response["SeriesDescription"],
+            },
+        )
+
     return [
         {
             "PatientName": patient_name,
@@ -223,22 +398,14 @@ def organize_flat_responses(
             "StudyID": study_id,
             "StudyInstanceUID": study_uid,
             "series": sorted(
-                [
-                    {
-                        "SeriesNumber": response["SeriesNumber"],
-                        "SeriesDescription": response["SeriesDescription"],
-                    }
-                    for response in responses
-                    if response["StudyInstanceUID"] == study_uid
-                ],
-                key=lambda series_dict: f'{int(series_dict["SeriesNumber"]):03d}',
+                series_by_uid.get(study_uid, []),
+                key=lambda series_dict: int(series_dict["SeriesNumber"]),
             ),
         }
-        for (
+        for study_uid, (
             patient_id,
             patient_name,
             patient_sex,
             study_id,
-            study_uid,
-        ) in patient_info
+        ) in patient_info.items()
     ]
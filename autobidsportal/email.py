@@ -45,3 +45,34 @@ def send_email(
         )
     except SMTPAuthenticationError as err:
         current_app.logger.error(err)
+
+
+def queue_email(
+    subject: str,
+    body: str,
+    additional_recipients: Collection[str] | None = None,
+):
+    """Send an email from the task queue instead of the current request.
+
+    Parameters
+    ----------
+    subject
+        Email subject
+
+    body
+        Main text (body) of email
+
+    additional_recipients
+        Additional addresses to send email to
+    """
+    if not current_app.config["MAIL_ENABLED"]:
+        return
+    # Enqueue through the tasks module so the worker has an app context
+    current_app.task_queue.enqueue(  # pyright: ignore
+        "autobidsportal.tasks.send_email",
+        subject,
+        body,
+        additional_recipients=(
+            list(additional_recipients) if additional_recipients else None
+        ),
+    )
@@ -2,7 +2,8 @@
 from __future__ import annotations
 
 import os
-from collections.abc import Collection
+from collections.abc import Collection, Iterator
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any
 
 SPACE = "    "
@@ -11,12 +12,66 @@ TEE = "├── "
 LAST = "└── "
 
 
+def _scan_dir(
+    path: os.PathLike[str] | str,
+    ignore: Collection,
+) -> tuple[list[str], list[tuple[str, str]]]:
+    """List the files and subdirectories of a single directory.
+
+    Symlinks (e.g. annexed files) are listed as files. Symlinks to
+    directories are also followed and listed as subdirectories.
+
+    Returns
+    -------
+    tuple[list[str], list[tuple[str, str]]]
+        File names, and (name, path) pairs for each subdirectory.
+    """
+    files = []
+    subdirs = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.name in ignore:
+                continue
+            if entry.is_file() or entry.is_symlink():
+                files.append(entry.name)
+            if entry.is_dir():
+                subdirs.append((entry.name, entry.path))
+    return files, subdirs
+
+
+def _walk_dir(
+    path: os.PathLike[str] | str,
+    ignore: Collection,
+) -> dict[str, list[str] | dict[str, dict[str, Any]]]:
+    """Build the dir_dict of a tree in the calling thread.
+
+    This walks iteratively so deep trees can't hit the recursion limit, and
+    so only one directory handle is open at a time.
+    """
+    root_dict = {"files": [], "dirs": {}}
+    to_scan = [(path, root_dict)]
+    while to_scan:
+        dir_path, dir_dict = to_scan.pop()
+        files, subdirs = _scan_dir(dir_path, ignore)
+        dir_dict["files"] = files
+        for name, subdir_path in subdirs:
+            child_dict = {"files": [], "dirs": {}}
+            dir_dict["dirs"][name] = child_dict
+            to_scan.append((subdir_path, child_dict))
+
+    return root_dict
+
+
 def gen_dir_dict(
     path: os.PathLike[str] | str,
     ignore: Collection = frozenset(),
+    max_workers: int = 8,
 ) -> dict[str, list[str] | dict[str, dict[str, Any]]]:
     """Generate a dictionary representing a file tree.
 
+    Each top-level subdirectory is walked in its own worker thread, so I/O
+    waits on slow (e.g. network) storage overlap.
+
     Parameters
     ----------
     path
@@ -25,6 +80,9 @@ def gen_dir_dict(
     ignore
         File/directory names to ignore.
 
+    max_workers
+        Maximum number of top-level subdirectories to walk concurrently.
+
     Returns
     -------
     dict
@@ -45,17 +103,29 @@ def gen_dir_dict(
             },
         }
     """
+    # Every entry in the tree is checked against ignore, so make sure that
+    # is a hash lookup even if the caller passed a list or tuple
+    ignore = frozenset(ignore)
+    files, subdirs = _scan_dir(path, ignore)
+    if len(subdirs) <= 1 or max_workers <= 1:
+        sub_dicts = [
+            _walk_dir(subdir_path, ignore) for _, subdir_path in subdirs
+        ]
+    else:
+        with ThreadPoolExecutor(
+            max_workers=min(max_workers, len(subdirs)),
+        ) as executor:
+            sub_dicts = list(
+                executor.map(
+                    lambda subdir: _walk_dir(subdir[1], ignore),
+                    subdirs,
+                ),
+            )
+
     return {
-        "files": [
-            entry.name
-            for entry in os.scandir(path)
-            if (entry.is_file() or entry.is_symlink())
-            and entry.name not in ignore
-        ],
+        "files": files,
         "dirs": {
-            entry.name: gen_dir_dict(entry.path, ignore)
-            for entry in os.scandir(path)
-            if entry.is_dir() and entry.name not in ignore
+            name: sub_dict for (name, _), sub_dict in zip(subdirs, sub_dicts)
         },
     }
 
@@ -63,7 +133,7 @@ def gen_dir_dict(
 def render_dir_dict(
     dir_dict: dict[str, Any],
     prefix: str = "",
-) -> list[str]:
+) -> Iterator[str]:
     """Render a dir_dict in the style of UNIX tree.
 
     Parameters
@@ -75,27 +145,20 @@ def render_dir_dict(
         Prefix string to add to each line.
 
 
-    Returns
-    -------
-    list[str]
-        Strings that when joined by newlines will render the dir_dict.
+    Yields
+    ------
+    str
+        Lines that when joined by newlines will render the dir_dict.
     """
-    all_contents = dir_dict["files"] + list(dir_dict["dirs"].keys())
-    pointers = [TEE for _ in range(len(all_contents) - 1)] + [LAST]
-    lines = []
-
-    for pointer, file_ in zip(
-        pointers[: len(dir_dict["files"])],
-        dir_dict["files"],
-    ):
-        lines.append(f"{prefix}{pointer}{file_}")
-
-    for pointer, (key, val) in zip(
-        pointers[len(dir_dict["files"]) :],
-        dir_dict["dirs"].items(),
-    ):
-        lines.append(f"{prefix}{pointer}{key}")
-        extension = BRANCH if pointer == TEE else SPACE
-        lines.extend(render_dir_dict(val, prefix=f"{prefix}{extension}"))
-
-    return lines
+    files = dir_dict["files"]
+    dirs = dir_dict["dirs"]
+    last_idx = len(files) + len(dirs) - 1
+
+    for idx, file_ in enumerate(files):
+        yield f"{prefix}{LAST if idx == last_idx else TEE}{file_}"
+
+    for idx, (key, val) in enumerate(dirs.items(), start=len(files)):
+        is_last = idx == last_idx
+        yield f"{prefix}{LAST if is_last else TEE}{key}"
+        extension = SPACE if is_last else BRANCH
+        yield from render_dir_dict(val, prefix=f"{prefix}{extension}")
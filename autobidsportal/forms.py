@@ -2,10 +2,11 @@
 from __future__ import annotations
 
 from functools import lru_cache
-from json import dumps
+from json import loads
 from pathlib import Path
 
 from flask_wtf import FlaskForm
+from sqlalchemy import exists
 from wtforms import (
     BooleanField,
     PasswordField,
@@ -29,7 +30,7 @@ from wtforms.validators import (
 
 from autobidsportal.models import ExplicitPatient, GlobusUsername, Study, User
 
-DEFAULT_HEURISTICS = [
+DEFAULT_HEURISTICS = (
     "cfmm_baron.py",
     "cfmm_base.py",
     "cfmm_bold_rest.py",
@@ -42,15 +43,32 @@ DEFAULT_HEURISTICS = [
     "GEvSE.py",
     "Kohler_HcECT.py",
     "Menon_CogMS.py",
-]
+)
 
-CHOICES_FAMILIARITY = [
+CHOICES_FAMILIARITY = (
     ("1", "Not familiar at all"),
     ("2", "Have heard of it"),
     ("3", "Have used of it"),
     ("4", "Used it regularly"),
     ("5", "I consider myself an expert"),
-]
+)
+
+# Stateless, so one instance is shared by every familiarity field
+VALIDATORS_FAMILIARITY = (InputRequired(),)
+
+CHOICES_STATUS = (
+    ("undergraduate", "Undergraduate Student"),
+    ("graduate", "Graduate Student"),
+    ("staff", "Staff"),
+    ("post-doc", "Post-Doc"),
+    ("faculty", "Faculty"),
+    ("other", "Other"),
+)
+
+CHOICES_SCANNER = (
+    ("type1", "3T"),
+    ("type2", "7T"),
+)
 
 
 @lru_cache
@@ -84,7 +102,7 @@ def _gen_familiarity_field(label: str) -> SelectField:
     return SelectField(
         label,
         choices=CHOICES_FAMILIARITY,
-        validators=[InputRequired()],
+        validators=VALIDATORS_FAMILIARITY,
     )
 
 
@@ -118,10 +136,9 @@ def unique_email(_, email: str):
         If email address is already registered to an account
 
     """
-    if (
-        User.query.filter_by(email=email.data).one_or_none()  # pyright: ignore
-        is not None
-    ):
+    if User.query.session.query(  # pyright: ignore
+        exists().where(User.email == email.data),
+    ).scalar():
         msg = (
             "There is already an account using this email address. Please use "
             "a different email address."
@@ -176,23 +193,13 @@ class BidsForm(FlaskForm):
 
     status = RadioField(
         "Current status:",
-        choices=[
-            ("undergraduate", "Undergraduate Student"),
-            ("graduate", "Graduate Student"),
-            ("staff", "Staff"),
-            ("post-doc", "Post-Doc"),
-            ("faculty", "Faculty"),
-            ("other", "Other"),
-        ],
+        choices=CHOICES_STATUS,
         validators=[InputRequired()],
     )
 
     scanner = RadioField(
         "Which scanner?:",
-        choices=[
-            ("type1", "3T"),
-            ("type2", "7T"),
-        ],
+        choices=CHOICES_SCANNER,
         validators=[InputRequired()],
     )
 
@@ -404,6 +411,12 @@ class StudyConfigForm(FlaskForm):
             self.patient_re.default = ".*"
         else:
             self.patient_re.default = study.patient_name_re
+        included_patients, excluded_patients = [], []
+        for patient in study.explicit_patients:  # pyright: ignore
+            if patient.included:
+                included_patients.append(patient)
+            else:
+                excluded_patients.append(patient)
         self.excluded_patients.choices = [
             (
                 patient.study_instance_uid,
@@ -412,13 +425,10 @@ class StudyConfigForm(FlaskForm):
                     f"Study ID: {patient.dicom_study_id}"
                 ),
             )
-            for patient in study.explicit_patients  # pyright: ignore
-            if not patient.included
+            for patient in excluded_patients
         ]
         self.excluded_patients.default = [
-            patient.study_instance_uid
-            for patient in study.explicit_patients  # pyright: ignore
-            if not patient.included
+            patient.study_instance_uid for patient in excluded_patients
         ]
         self.newly_excluded.default = ""
         self.included_patients.choices = [
@@ -429,13 +439,10 @@ class StudyConfigForm(FlaskForm):
                     f"Study ID: {patient.dicom_study_id}"
                 ),
             )
-            for patient in study.explicit_patients  # pyright: ignore
-            if patient.included
+            for patient in included_patients
         ]
         self.included_patients.default = [
-            patient.study_instance_uid
-            for patient in study.explicit_patients  # pyright: ignore
-            if patient.included
+            patient.study_instance_uid for patient in included_patients
         ]
         self.newly_included.default = ""
         self.users_authorized.choices = [
@@ -489,8 +496,9 @@ class StudyConfigForm(FlaskForm):
         -------
         tuple[Study, list[ExplicitPatient], list[ExplicitPatient], list[int | None]]
             A tuple containing the updated study, a list of new
-            ExplicitPatients to add, a list of existing ExplicitPatients to
+            ExplicitPatients to add, a list of existing GlobusUsernames to
             delete, and a list of IDs of users to add to the authorized list.
+            Unchecked ExplicitPatients are deleted directly.
         """
         to_add: list[ExplicitPatient] = []
         to_delete: list[ExplicitPatient] = []
@@ -535,21 +543,18 @@ class StudyConfigForm(FlaskForm):
         study.patient_str = self.patient_str.data
         study.patient_name_re = self.patient_re.data
         study.custom_bidsignore = self.bidsignore.data
-        for explicit_patient in study.explicit_patients:  # pyright: ignore
-            if (
-                explicit_patient.included
-                and (
-                    explicit_patient.study_instance_uid
-                    not in self.included_patients.data
-                )
-            ) or (
-                (not explicit_patient.included)
-                and (
-                    explicit_patient.study_instance_uid
-                    not in self.excluded_patients.data
-                )
-            ):
-                to_delete.append(explicit_patient)
+        # Drop unchecked explicit patients in bulk. "evaluate" also removes
+        # any already loaded from the session, so a UID re-entered below
+        # doesn't collide with its stale object
+        for included, kept_uids in (
+            (True, self.included_patients.data),
+            (False, self.excluded_patients.data),
+        ):
+            ExplicitPatient.query.filter(
+                ExplicitPatient.study_id == study.id,
+                ExplicitPatient.included.is_(included),
+                ExplicitPatient.study_instance_uid.not_in(kept_uids or ()),
+            ).delete(synchronize_session="evaluate")
 
         # "New" participants to exclude
         if self.newly_excluded.data:
@@ -615,7 +620,7 @@ class ExcludeScansForm(FlaskForm):
 
     choices_to_exclude = MultiCheckboxField(
         "Exclude from study",
-        coerce=dumps,  # pyright: ignore
+        coerce=loads,  # pyright: ignore
     )
 
 
@@ -624,7 +629,7 @@ class IncludeScansForm(FlaskForm):
 
     choices_to_include = MultiCheckboxField(
         "Include in study",
-        coerce=dumps,  # pyright: ignore
+        coerce=loads,  # pyright: ignore
     )
 
 
@@ -633,5 +638,5 @@ class ExplicitCfmm2tarForm(FlaskForm):
 
     choices_to_run = MultiCheckboxField(
         "Include in cfmm2tar run",
-        coerce=dumps,  # pyright: ignore
+        coerce=loads,  # pyright: ignore
     )
@@ -4,19 +4,16 @@
 # ruff: noqa: A003
 from __future__ import annotations
 
-import json
 from collections.abc import Sequence
 from datetime import datetime
 from enum import Enum
 from time import time
 from typing import Any
+from uuid import uuid4
 
 from flask import current_app
 from flask_login import LoginManager, UserMixin
 from flask_sqlalchemy import SQLAlchemy
-from redis.exceptions import RedisError
-from rq.exceptions import NoSuchJobError
-from rq.job import Job
 from sqlalchemy import MetaData
 from werkzeug.security import check_password_hash, generate_password_hash
 
@@ -73,11 +70,11 @@ class Notification(db.Model):
     name = db.Column(db.String(128), index=True, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
     timestamp = db.Column(db.Float, index=True, default=time)
-    payload_json = db.Column(db.Text, nullable=False)
+    payload = db.Column(db.JSON(), nullable=False)
 
     def get_data(self):
         """Get the notification contents."""
-        return json.loads(str(self.payload_json))
+        return self.payload
 
     def __repr__(self) -> str:
         """Generate a str representation of this notification."""
@@ -87,13 +84,15 @@ class Notification(db.Model):
 class Task(db.Model):
     """A task deferred to the task queue."""
 
-    TASKS = (
-        "run_cfmm2tar",
-        "run_tar2bids",
-        "update_heuristics",
-        "archive_raw_data",
-        "gradcorrect_study",
-        "archive_derivative_data",
+    TASKS = frozenset(
+        {
+            "run_cfmm2tar",
+            "run_tar2bids",
+            "update_heuristics",
+            "archive_raw_data",
+            "gradcorrect_study",
+            "archive_derivative_data",
+        },
     )
 
     id = db.Column(db.String(36), primary_key=True)
@@ -108,8 +107,23 @@ class Task(db.Model):
     end_time = db.Column(db.DateTime, nullable=True)
     log = db.Column(db.Text, nullable=True)
 
+    __table_args__ = (
+        db.Index("ix_task_user_complete", "user_id", "complete"),
+        db.Index("ix_task_study_complete", "study_id", "complete"),
+        db.Index(
+            "ix_task_study_name_complete",
+            "study_id",
+            "name",
+            "complete",
+        ),
+    )
+
     def __repr__(self) -> str:
         """Generate a string representation of this task."""
+        return f"<Task {self.id} {self.name}>"
+
+    def dump(self) -> str:
+        """Generate a detailed string representation of this task."""
         task_cols = (
             self.user_id,
             self.study_id,
@@ -164,6 +178,8 @@ class Task(db.Model):
             msg = "Invalid task name"
             raise ValueError(msg)
 
+        from rq.job import Job
+
         rq_job = Job.create(
             f"autobidsportal.tasks.{name}",
             args=args,
@@ -187,8 +203,80 @@ class Task(db.Model):
 
         return task
 
+    @classmethod
+    def launch_study_tasks(
+        cls,
+        name: str,
+        description: str,
+        study_ids: Sequence[int],
+        timeout: int = 100000,
+    ) -> list[str]:
+        """Enqueue one task per study with rq and record them in the DB.
+
+        The tasks are inserted in one statement and the jobs enqueued in one
+        redis pipeline, rather than one round trip of each per study. Each
+        task function receives its study's id as its only argument.
+
+        Parameters
+        ----------
+        name
+            Task name to complete
+
+        description
+            Description of every task
+
+        study_ids
+            Ids of the studies to launch a task for
+
+        timeout
+            Time in milliseconds before each task times out
+
+        Returns
+        -------
+        list[str]
+            IDs of the launched tasks
+        """
+        if name not in cls.TASKS:
+            msg = "Invalid task name"
+            raise ValueError(msg)
+
+        job_ids = [str(uuid4()) for _ in study_ids]
+        start_time = datetime.now(tz=TIME_ZONE)
+        db.session.bulk_insert_mappings(  # pyright: ignore
+            cls,
+            [
+                {
+                    "id": job_id,
+                    "name": name,
+                    "description": description,
+                    "start_time": start_time,
+                    "study_id": study_id,
+                }
+                for job_id, study_id in zip(job_ids, study_ids)
+            ],
+        )
+        db.session.commit()  # pyright: ignore
+        task_queue = current_app.task_queue  # pyright: ignore
+        task_queue.enqueue_many(
+            [
+                task_queue.prepare_data(
+                    f"autobidsportal.tasks.{name}",
+                    args=(study_id,),
+                    timeout=timeout,
+                    job_id=job_id,
+                )
+                for job_id, study_id in zip(job_ids, study_ids)
+            ],
+        )
+
+        return job_ids
+
     def get_rq_job(self):
         """Get the rq job associated with this task."""
+        from redis.exceptions import RedisError
+        from rq.exceptions import NoSuchJobError
+        from rq.job import Job
+
         try:
             rq_job = Job.fetch(
                 self.id,
@@ -204,6 +292,16 @@ class Task(db.Model):
         return job.meta.get("progress", 0) if job is not None else 100
 
 
+# Columns needed to list a task in the UI
+TASK_SUMMARY_COLUMNS = (
+    Task.id,
+    Task.name,
+    Task.description,
+    Task.error,
+    Task.end_time,
+)
+
+
 class User(UserMixin, db.Model):
     """Information related to registered users."""
 
@@ -264,12 +362,16 @@ class User(UserMixin, db.Model):
         Notification
             Notification object
         """
-        Notification.query.filter_by(name=name, user_id=self.id).delete()
+        # Nothing reads the replaced notifications back through the session,
+        # so skip matching them against the identity map.
+        Notification.query.filter_by(name=name, user_id=self.id).delete(
+            synchronize_session=False,
+        )
 
         notification = Notification(
             name=name,
-            payload_json=json.dumps(data),
-            user=self,
+            payload=data,
+            user_id=self.id,
         )
 
         db.session.add(notification)  # pyright: ignore
@@ -286,6 +388,21 @@ class User(UserMixin, db.Model):
         """
         return Task.query.filter_by(user=self, complete=True).all()
 
+    def get_completed_tasks_summary(self) -> Sequence[Any]:
+        """Get display information about all completed tasks.
+
+        Returns
+        -------
+        Sequence[Row]
+            One (id, name, description, error, end_time) row per completed
+            task associated with this user.
+        """
+        return (
+            Task.query.with_entities(*TASK_SUMMARY_COLUMNS)
+            .filter_by(user_id=self.id, complete=True)
+            .all()
+        )
+
     def get_task_in_progress(self, name: str):
         """Get this user's active task with the given name.
 
@@ -373,7 +490,7 @@ class Study(db.Model):
     users_authorized = db.relationship(
         "User",
         secondary=accessible_studies,
-        lazy="subquery",
+        lazy="selectin",
         backref=db.backref("studies", lazy=True),
     )
     patient_name_re = db.Column(db.Text())
@@ -392,7 +509,11 @@ class Study(db.Model):
         lazy=True,
     )
     dataset_content = db.Column(db.JSON(), nullable=True)
-    datalad_datasets = db.relationship("DataladDataset", backref="study")
+    datalad_datasets = db.relationship(
+        "DataladDataset",
+        backref="study",
+        lazy="selectin",
+    )
 
     custom_ria_url = db.Column(db.Text, nullable=True)
     globus_usernames = db.relationship("GlobusUsername", backref="study")
@@ -400,7 +521,11 @@ class Study(db.Model):
     custom_bidsignore = db.Column(db.Text, nullable=True)
 
     def __repr__(self) -> str:
-        """Generate a str representation of this study."""
+        """Generate a short str representation of this study."""
+        return f"<Study {self.id} {self.project_name!r}>"
+
+    def dump(self) -> str:
+        """Generate a str representation of all this study's answers."""
         answer_cols = (
             self.status,
             self.scanner,
@@ -437,6 +562,21 @@ class Study(db.Model):
         """
         return Task.query.filter_by(study=self, complete=False).all()
 
+    def get_tasks_in_progress_summary(self) -> Sequence[Any]:
+        """Get display information about all active tasks of this study.
+
+        Returns
+        -------
+        Sequence[Row]
+            One (id, name, description, error, end_time) row per active
+            task in the study.
+        """
+        return (
+            Task.query.with_entities(*TASK_SUMMARY_COLUMNS)
+            .filter_by(study_id=self.id, complete=False)
+            .all()
+        )
+
     def update_custom_ria_url(self, new_url: str | None):
         """Update custom ria URL for this study and its associated datasets.
 
@@ -446,15 +586,22 @@ class Study(db.Model):
             New RIA url for study (Optional)
         """
         self.custom_ria_url = new_url
-        for dataset in self.datalad_datasets:  # pyright: ignore
-            dataset.custom_ria_url = new_url
+        DataladDataset.query.filter_by(study_id=self.id).update(
+            {"custom_ria_url": new_url},
+            synchronize_session="fetch",
+        )
 
 
 class Cfmm2tarOutput(db.Model):
     """One completed cfmm2tar run."""
 
     id = db.Column(db.Integer, primary_key=True)
-    study_id = db.Column(db.Integer, db.ForeignKey("study.id"), nullable=False)
+    study_id = db.Column(
+        db.Integer,
+        db.ForeignKey("study.id"),
+        nullable=False,
+        index=True,
+    )
     tar_file = db.Column(db.String(200), index=True, nullable=False)
     attached_tar_file = db.Column(db.Text, nullable=True)
     uid = db.Column(db.String(200), index=True, nullable=False)
@@ -463,6 +610,7 @@ class Cfmm2tarOutput(db.Model):
         db.Integer,
         db.ForeignKey("datalad_dataset.id"),
         nullable=True,
+        index=True,
     )
     tar2bids_outputs = db.relationship(
         "Tar2bidsOutput",
@@ -473,6 +621,10 @@ class Cfmm2tarOutput(db.Model):
 
     def __repr__(self) -> str:
         """Generate a str representation of this output."""
+        return f"<Cfmm2tar {self.id} {self.tar_file}>"
+
+    def dump(self) -> str:
+        """Generate a detailed str representation of this output."""
         return f"<Cfmm2tar {self.tar_file, self.uid, self.date}>"
 
 
@@ -480,14 +632,18 @@ class Tar2bidsOutput(db.Model):
     """One completed tar2bids run."""
 
     id = db.Column(db.Integer, primary_key=True)
-    study_id = db.Column(db.Integer, db.ForeignKey("study.id"), nullable=False)
+    study_id = db.Column(
+        db.Integer,
+        db.ForeignKey("study.id"),
+        nullable=False,
+        index=True,
+    )
     bids_dir = db.Column(db.String(200), index=True, nullable=True)
     heuristic = db.Column(db.String(200), index=True)
 
     def __repr__(self) -> str:
         """Generate a str representation of this output."""
-        out_fields = (self.cfmm2tar_output_id, self.bids_dir, self.heuristic)
-        return f"<Tar2bids {out_fields}>"
+        return f"<Tar2bids {self.id} {self.bids_dir}>"
 
 
 class DatasetType(Enum):
@@ -511,7 +667,12 @@ class DataladDataset(db.Model):
     """A datalad dataset relating to a study."""
 
     id = db.Column(db.Integer, primary_key=True)
-    study_id = db.Column(db.Integer, db.ForeignKey("study.id"), nullable=False)
+    study_id = db.Column(
+        db.Integer,
+        db.ForeignKey("study.id"),
+        nullable=False,
+        index=True,
+    )
     dataset_type = db.Column(db.Enum(DatasetType), nullable=False)
     ria_alias = db.Column(db.String, nullable=False, unique=True)
     custom_ria_url = db.Column(db.Text, nullable=True)
@@ -534,17 +695,24 @@ class DatasetArchive(db.Model):
         db.Integer,
         db.ForeignKey("datalad_dataset.id"),
         nullable=False,
+        index=True,
     )
     parent_id = db.Column(
         db.Integer,
         db.ForeignKey("dataset_archive.id"),
         nullable=True,
+        index=True,
     )
     parent = db.relationship("DatasetArchive", remote_side=[id])
     dataset_hexsha = db.Column(db.Text, nullable=False)
     commit_datetime = db.Column(db.DateTime, nullable=False)
 
 
+# Redis key incremented whenever the PI list is replaced, so processes that
+# cache the PI names know to reload them
+PRINCIPAL_VERSION_KEY = "principal_names_version"
+
+
 class Principal(db.Model):
     """One PI name known on the DICOM scanner."""
 
@@ -560,7 +728,12 @@ class ExplicitPatient(db.Model):
     """A tar file to be explicitly included in or excluded from a study."""
 
     id = db.Column(db.Integer, primary_key=True)
-    study_id = db.Column(db.Integer, db.ForeignKey("study.id"), nullable=False)
+    study_id = db.Column(
+        db.Integer,
+        db.ForeignKey("study.id"),
+        nullable=False,
+        index=True,
+    )
     study_instance_uid = db.Column(db.String(64), unique=True)
     patient_name = db.Column(db.String(194))
     dicom_study_id = db.Column(db.String(16))
@@ -571,5 +744,10 @@ class GlobusUsername(db.Model):
     """A globus username that should be given access to a study's archive."""
 
     id = db.Column(db.Integer, primary_key=True)
-    study_id = db.Column(db.Integer, db.ForeignKey("study.id"), nullable=False)
+    study_id = db.Column(
+        db.Integer,
+        db.ForeignKey("study.id"),
+        nullable=False,
+        index=True,
+    )
     username = db.Column(db.Text, nullable=False)
@@ -1,14 +1,17 @@
 """All routes in the portal are defined here."""
 from __future__ import annotations
 
+import csv
+import io
+import os
 import tempfile
 import uuid
 from datetime import datetime
-from json import dumps, loads
+from json import dumps
+from operator import itemgetter
 from pathlib import Path
-from typing import NoReturn
+from typing import Any, NoReturn
 
-import flask_excel as excel
 from flask import (
     Blueprint,
     abort,
@@ -18,10 +21,13 @@ from flask import (
     redirect,
     render_template,
     request,
+    stream_with_context,
     url_for,
 )
 from flask_login import current_user, login_required, login_user, logout_user
-from sqlalchemy import desc
+from flask_sqlalchemy.record_queries import get_recorded_queries
+from sqlalchemy import desc, exists, inspect
+from sqlalchemy.orm import lazyload, load_only, selectinload
 from werkzeug.urls import url_parse
 from werkzeug.wrappers.response import Response
 
@@ -34,7 +40,7 @@ from autobidsportal.datalad import (
 from autobidsportal.dateutils import TIME_ZONE
 from autobidsportal.dcm4cheutils import Dcm4cheError
 from autobidsportal.dicom import get_study_records
-from autobidsportal.email import send_email
+from autobidsportal.email import queue_email
 from autobidsportal.forms import (
     DEFAULT_HEURISTICS,
     AccessForm,
@@ -51,18 +57,35 @@ from autobidsportal.forms import (
     Tar2bidsRunForm,
 )
 from autobidsportal.models import (
+    PRINCIPAL_VERSION_KEY,
     Cfmm2tarOutput,
     DataladDataset,
+    DatasetArchive,
     DatasetType,
     ExplicitPatient,
     Principal,
     Study,
     Task,
     User,
+    accessible_studies,
     db,
 )
 from autobidsportal.ssh import remove_zip_files
 
+# Number of studies fetched per round trip when streaming the CSV report
+DOWNLOAD_BATCH_SIZE = 500
+
+# Human-readable labels for stored survey answers in the CSV report
+FAMILIARITY_LABELS = {
+    "1": "Not familiar at all",
+    "2": "Have heard of it",
+    "3": "Have used it before",
+    "4": "Used it regularly",
+    "5": "I consider myself an expert",
+}
+SCANNER_LABELS = {"type1": "3T", "type2": "7T"}
+BOOL_LABELS = {True: "Yes", False: "No"}
+
 portal_blueprint = Blueprint(
     "portal_blueprint",
     __name__,
@@ -78,12 +101,181 @@ def check_current_authorized(study: Study):
     study
         Study to check for user authorization
     """
-    if (not current_user.admin) and (  # pyright: ignore
-        current_user not in study.users_authorized
-    ):
+    if current_user.admin:  # pyright: ignore
+        return
+    if "users_authorized" in inspect(study).unloaded:
+        # Ask for this one membership rather than loading every user
+        authorized = db.session.query(  # pyright: ignore
+            exists().where(
+                accessible_studies.c.study_id == study.id,
+                accessible_studies.c.user_id == current_user.id,
+            ),
+        ).scalar()
+    else:
+        authorized = current_user in study.users_authorized
+    if not authorized:
         abort(404)
 
 
+def get_authorized_study(study_id: int, *options: Any) -> Study:
+    """Get a study the current user is authorized to view.
+
+    The study's authorized users aren't loaded, so a non-admin's access is
+    checked with a single EXISTS query instead.
+
+    Parameters
+    ----------
+    study_id
+        ID of the study to get
+
+    *options
+        Extra loader options to apply to the study query
+
+    Returns
+    -------
+    Study
+        The requested study. Aborts with 404 if it doesn't exist or the
+        current user isn't authorized to view it.
+    """
+    study = Study.query.options(
+        lazyload(Study.users_authorized),
+        *options,
+    ).get_or_404(study_id)
+    check_current_authorized(study)
+    return study
+
+
+def get_principal_names() -> tuple[str, ...]:
+    """Get the names of all known PIs.
+
+    The names are cached on the app and only reloaded when check_pis has
+    bumped the PI list version in redis since they were fetched. If redis is
+    unavailable, the names are read from the database.
+
+    Returns
+    -------
+    tuple[str, ...]
+        Names of all principals in the database
+    """
+    from redis.exceptions import RedisError
+
+    try:
+        version = current_app.redis.get(  # pyright: ignore
+            PRINCIPAL_VERSION_KEY,
+        )
+    except RedisError:
+        current_app.logger.warning("Could not read the PI list version")
+        return _query_principal_names()
+
+    cached = current_app.extensions.get("principal_names")
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    principal_names = _query_principal_names()
+    current_app.extensions["principal_names"] = (version, principal_names)
+    return principal_names
+
+
+def _query_principal_names() -> tuple[str, ...]:
+    """Read the names of all known PIs from the database."""
+    return tuple(
+        principal_name
+        for (principal_name,) in db.session.query(  # pyright: ignore
+            Principal.principal_name,
+        )
+    )
+
+
+def get_available_heuristics() -> list[tuple[str, str]]:
+    """Get the heuristic choices offered in the study config form.
+
+    The listing of the heuristic repo is cached on the app and only rebuilt
+    when the heuristic directory's modification time changes, i.e. when
+    update_heuristics adds, removes, or renames a heuristic.
+
+    Returns
+    -------
+    list[tuple[str, str]]
+        (value, label) pairs for git and container heuristics, sorted by
+        label
+    """
+    heuristic_dir = (
+        Path(current_app.config["HEURISTIC_REPO_PATH"])
+        / current_app.config["HEURISTIC_DIR_PATH"]
+    )
+    mtime = heuristic_dir.stat().st_mtime_ns
+    cached = current_app.extensions.get("available_heuristics")
+    if cached is not None and cached[0] == (heuristic_dir, mtime):
+        return cached[1]
+
+    with os.scandir(heuristic_dir) as entries:
+        git_heuristics = [
+            (entry.path, f"{entry.name} (git)") for entry in entries
+        ]
+    available_heuristics = sorted(
+        git_heuristics
+        + [
+            (heuristic, f"{heuristic} (container)")
+            for heuristic in DEFAULT_HEURISTICS
+        ],
+        key=lambda option: option[1].lower(),
+    )
+    current_app.extensions["available_heuristics"] = (
+        (heuristic_dir, mtime),
+        available_heuristics,
+    )
+    return available_heuristics
+
+
+def redirect_to_answer_info(study_id: int) -> Response:
+    """Send the browser back to a study's page after changing it.
+
+    Redirecting with 303 See Other makes the browser load the page with a
+    fresh GET, so refreshing it doesn't resubmit the change.
+
+    Parameters
+    ----------
+    study_id
+        ID of the study whose page to load
+
+    Returns
+    -------
+    Response
+        Redirect to the study's answer_info page
+    """
+    return redirect(
+        url_for("portal_blueprint.answer_info", study_id=study_id),
+        code=303,
+    )
+
+
+@portal_blueprint.after_app_request
+def log_slow_queries(response: Response) -> Response:
+    """Log queries from this request slower than SLOW_QUERY_THRESHOLD.
+
+    Parameters
+    ----------
+    response
+        Response about to be sent
+
+    Returns
+    -------
+    Response
+        The same response, unchanged
+    """
+    threshold = current_app.config.get("SLOW_QUERY_THRESHOLD")
+    if threshold is None:
+        return response
+    for query in get_recorded_queries():
+        if query.duration >= threshold:
+            current_app.logger.warning(
+                "Slow query (%.3fs) at %s: %s",
+                query.duration,
+                query.location,
+                query.statement,
+            )
+    return response
+
+
 @portal_blueprint.route("/", methods=["GET"])
 @portal_blueprint.route("/index", methods=["GET"])
 def index() -> str:
@@ -123,12 +315,10 @@ def new_study() -> str | Response:
         Rendered path to survey or refresh page if valid submission of form
     """
     form = BidsForm()
-    principal_names = [
-        (p.principal_name, p.principal_name)
-        for p in db.session.query(Principal).all()  # pyright: ignore
+    form.principal.choices = [("Other", "Other")] + [
+        (principal_name, principal_name)
+        for principal_name in get_principal_names()
     ]
-    form.principal.choices = principal_names
-    form.principal.choices.insert(0, ("Other", "Other"))
 
     if form.validate_on_submit():
         study = form.gen_study()
@@ -140,14 +330,17 @@ def new_study() -> str | Response:
             "If you haven't already, please add 'bidsdump' as an authorized user to "
             "your study on the CFMM DICOM server.",
         )
-        send_email(
+        queue_email(
             "New study request",
             (
                 f"A new request has been submitted by {form.name.data}"
                 f" ({form.email.data}). ID: {study.id}"
             ),
             additional_recipients=[
-                admin.email for admin in User.query.filter_by(admin=True).all()
+                email
+                for (email,) in db.session.query(User.email).filter(
+                    User.admin.is_(True),
+                )
             ],
         )
 
@@ -258,7 +451,7 @@ def gen_reset() -> str:
                     "portal_blueprint.reset_password",
                     uuid_reset=uuid_reset,
                 )
-                send_email(
+                queue_email(
                     "Autobids password reset",
                     (
                         "Please visit the following link to reset your "
@@ -340,7 +533,10 @@ def user_list() -> str:
     if not current_user.admin:  # pyright: ignore
         abort(404)
 
-    users = User.query.all()
+    # The listing only shows each user's ID, admin flag, and email
+    users = User.query.options(
+        load_only(User.id, User.admin, User.email),
+    ).all()
     ria_url = current_app.config["DATALAD_RIA_URL"]
     archive_url = current_app.config["ARCHIVE_BASE_URL"]
 
@@ -406,7 +602,11 @@ def admin(user_id: int) -> str:
     removal_form = RemoveAccessForm()
 
     # Get all available studies
-    all_studies = db.session.query(Study).all()  # pyright: ignore
+    all_studies = db.session.query(  # pyright: ignore
+        Study.id,
+        Study.principal,
+        Study.project_name,
+    ).all()
     form.choices.choices = [
         (study.id, f"{study.principal}^{study.project_name}")
         for study in all_studies
@@ -426,9 +626,11 @@ def admin(user_id: int) -> str:
             )
         # If form valid, authorize user to selected studies
         if form.validate_on_submit():
-            for study_id in form.choices.data:  # pyright: ignore
-                print(study_id)
-                study = Study.query.get(study_id)
+            for study in (
+                Study.query.filter(Study.id.in_(form.choices.data))
+                .options(selectinload(Study.users_authorized))
+                .all()
+            ):
                 current_app.logger.info(
                     "Added user %i to study %i.",
                     user.id,
@@ -439,10 +641,13 @@ def admin(user_id: int) -> str:
             db.session.commit()  # pyright: ignore
         # If valid form, remove user authorization from selected studies
         if removal_form.validate_on_submit():
-            for (
-                study_id
-            ) in removal_form.choices_to_remove.data:  # pyright: ignore
-                study = Study.query.get(study_id)
+            for study in (
+                Study.query.filter(
+                    Study.id.in_(removal_form.choices_to_remove.data),
+                )
+                .options(selectinload(Study.users_authorized))
+                .all()
+            ):
                 if user in study.users_authorized:
                     study.users_authorized.remove(user)
                     current_app.logger.info(
@@ -474,16 +679,13 @@ def results() -> str:
     """
     last = current_user.last_seen  # pyright: ignore
 
-    studies = (
-        Study.query.all()
-        if current_user.admin  # pyright: ignore
-        else current_user.studies  # pyright: ignore
-    )
-    studies = sorted(
-        studies,
-        key=lambda x: x.submission_date,
-        reverse=True,
-    )
+    # The listing doesn't show authorized users, so skip eager loading them
+    query = Study.query.options(lazyload(Study.users_authorized))
+    if not current_user.admin:  # pyright: ignore
+        query = query.join(Study.users_authorized).filter(
+            User.id == current_user.id,  # pyright: ignore
+        )
+    studies = query.order_by(Study.submission_date.desc()).all()
 
     return render_template(
         "results.html",
@@ -510,26 +712,35 @@ def answer_info(study_id: int):
 
     """
     # Retrieve study id and check current user is authorized
-    study = Study.query.get_or_404(study_id)
-    check_current_authorized(study)
+    study = get_authorized_study(
+        study_id,
+        selectinload(Study.cfmm2tar_outputs),
+        selectinload(Study.tar2bids_outputs),
+    )
 
-    # Query database to retrieve tasks and files associated with cfmm2tar
-    cfmm2tar_tasks = (
-        Task.query.filter_by(study_id=study_id, name="run_cfmm2tar")
+    # Query database once for the cfmm2tar and tar2bids tasks
+    cfmm2tar_tasks = []
+    tar2bids_tasks = []
+    for task in (
+        Task.query.filter(
+            Task.study_id == study_id,
+            Task.name.in_(("run_cfmm2tar", "run_tar2bids")),
+        )
         .order_by(desc("start_time"))
         .all()
-    )
+    ):
+        if task.name == "run_cfmm2tar":
+            cfmm2tar_tasks.append(task)
+        else:
+            tar2bids_tasks.append(task)
+
+    # Files associated with cfmm2tar
     cfmm2tar_files = study.cfmm2tar_outputs
     cfmm2tar_file_names = [
         Path(cfmm2tar_file.tar_file).name for cfmm2tar_file in cfmm2tar_files
     ]
 
-    # Query database to retrieve tasks and files associated with tar2bids
-    tar2bids_tasks = (
-        Task.query.filter_by(study_id=study_id, name="run_tar2bids")
-        .order_by(desc("start_time"))
-        .all()
-    )
+    # Files associated with tar2bids
     tar2bids_files = study.tar2bids_outputs
 
     # Dump dataset content to dictionary
@@ -538,7 +749,7 @@ def answer_info(study_id: int):
         if study.dataset_content is not None
         else {"files": [], "dirs": []}
     )
-    json_filetree = dumps(bids_dict)
+    json_filetree = dumps(bids_dict, separators=(",", ":"))
 
     # Query database for raw dataset archives
     archive_dataset = DataladDataset.query.filter_by(
@@ -591,8 +802,7 @@ def study_demographics(study_id: int) -> str:
     str
         Render page with study demographics
     """
-    study = Study.query.get_or_404(study_id)
-    check_current_authorized(study)
+    study = get_authorized_study(study_id)
 
     return render_template("study_demographics.html", study=study)
 
@@ -615,8 +825,10 @@ def study_config(study_id: int) -> str:
     str
         Render page for study config with option to edit
     """
-    study = Study.query.get_or_404(study_id)
-    check_current_authorized(study)
+    study = get_authorized_study(
+        study_id,
+        selectinload(Study.explicit_patients),
+    )
 
     form = StudyConfigForm()
     if request.method == "POST":
@@ -624,9 +836,9 @@ def study_config(study_id: int) -> str:
             study,
             user_is_admin=current_user.admin,  # pyright: ignore
         )
-        study.users_authorized = [  # pyright: ignore
-            User.query.get(user_id) for user_id in users_authorized
-        ]
+        study.users_authorized = User.query.filter(  # pyright: ignore
+            User.id.in_(users_authorized),
+        ).all()
 
         for patient in to_add:
             db.session.add(patient)  # pyright: ignore
@@ -637,33 +849,15 @@ def study_config(study_id: int) -> str:
         current_app.logger.info("Updated study %i config", study.id)
         db.session.commit()  # pyright: ignore
 
-    available_heuristics = sorted(
-        [
-            (str(heuristic_path), f"{heuristic_path.name} (git)")
-            for heuristic_path in (
-                Path(current_app.config["HEURISTIC_REPO_PATH"])
-                / current_app.config["HEURISTIC_DIR_PATH"]
-            ).iterdir()
-        ]
-        + [
-            (heuristic, f"{heuristic} (container)")
-            for heuristic in DEFAULT_HEURISTICS
-        ],
-        key=lambda option: option[1].lower(),
-    )
-
-    principal_names = [
-        p.principal_name
-        for p in db.session.query(Principal).all()  # pyright: ignore
-    ]
+    principal_names = list(get_principal_names())
     if study.principal not in principal_names:
         principal_names.insert(0, study.principal)
 
     form.defaults_from_study(
         study,
         principal_names,
-        available_heuristics,
-        User.query.all(),
+        get_available_heuristics(),
+        User.query.options(load_only(User.id, User.email)).all(),
     )
 
     return render_template(
@@ -676,7 +870,7 @@ def study_config(study_id: int) -> str:
 
 @portal_blueprint.route("/results/<int:study_id>/cfmm2tar", methods=["POST"])
 @login_required
-def run_cfmm2tar(study_id: int):
+def run_cfmm2tar(study_id: int) -> Response:
     """Launch cfmm2tar task and refresh answer_info.html.
 
     Parameters
@@ -686,36 +880,25 @@ def run_cfmm2tar(study_id: int):
 
     Returns
     -------
-    str
-        Render page to launch cfmm2tar task
+    Response
+        Redirect to the study's answer_info page
     """
-    study = Study.query.get_or_404(study_id)
-    check_current_authorized(study)
-    if (
-        len(
-            Task.query.filter_by(
-                study_id=study_id,
-                name="run_cfmm2tar",
-                complete=False,
-            ).all(),
-        )
-        > 0
-    ):
+    study = get_authorized_study(study_id)
+    if db.session.query(  # pyright: ignore
+        Task.query.filter_by(
+            study_id=study_id,
+            name="run_cfmm2tar",
+            complete=False,
+        ).exists(),
+    ).scalar():
         flash("An Cfmm2tar run is currently in progress")
-        return answer_info(study_id)
+        return redirect_to_answer_info(study_id)
     if not study.active:
-        return answer_info(study_id)
+        return redirect_to_answer_info(study_id)
 
     form = ExplicitCfmm2tarForm()
 
-    explicit_scans = (
-        [
-            loads(loads(val_json))
-            for val_json in form.choices_to_run.data  # pyright: ignore
-        ]
-        if form.choices_to_run.data not in [None, []]
-        else None
-    )
+    explicit_scans = form.choices_to_run.data or None
     current_app.task_queue.enqueue(  # pyright: ignore
         "autobidsportal.tasks.check_tar_files",
         study_id,
@@ -725,7 +908,7 @@ def run_cfmm2tar(study_id: int):
     current_app.logger.info("Launched cfmm2tar for study %i", study_id)
     db.session.commit()  # pyright: ignore
 
-    return answer_info(study_id)
+    return redirect_to_answer_info(study_id)
 
 
 @portal_blueprint.route(
@@ -737,7 +920,7 @@ def run_cfmm2tar(study_id: int):
     methods=["DELETE"],
 )
 @login_required
-def delete_cfmm2tar(study_id: int, cfmm2tar_id: int):
+def delete_cfmm2tar(study_id: int, cfmm2tar_id: int) -> Response:
     """Delete a single tar file.
 
     Parameters
@@ -750,14 +933,13 @@ def delete_cfmm2tar(study_id: int, cfmm2tar_id: int):
 
     Returns
     -------
-    str
-        Render page with survey response based on study id
+    Response
+        Redirect to the study's answer_info page
     """
-    study = Study.query.get_or_404(study_id)
-    check_current_authorized(study)
+    study = get_authorized_study(study_id)
 
     if not study.active:
-        return answer_info(study_id)
+        return redirect_to_answer_info(study_id)
 
     cfmm2tar_output = Cfmm2tarOutput.query.get(cfmm2tar_id)
     if (cfmm2tar_output is not None) and (
@@ -767,7 +949,7 @@ def delete_cfmm2tar(study_id: int, cfmm2tar_id: int):
         db.session.delete(cfmm2tar_output)  # pyright: ignore
         db.session.commit()  # pyright: ignore
 
-    return answer_info(study_id)
+    return redirect_to_answer_info(study_id)
 
 
 @portal_blueprint.route(
@@ -775,7 +957,7 @@ def delete_cfmm2tar(study_id: int, cfmm2tar_id: int):
     methods=["POST"],
 )
 @login_required
-def rename_cfmm2tar(study_id: int, cfmm2tar_id: int) -> str:
+def rename_cfmm2tar(study_id: int, cfmm2tar_id: int) -> Response:
     """Rename a single tar file.
 
     Parameters
@@ -788,14 +970,13 @@ def rename_cfmm2tar(study_id: int, cfmm2tar_id: int) -> str:
 
     Returns
     -------
-    str
-        Render page with survey response based on study id
+    Response
+        Redirect to the study's answer_info page
     """
-    study = Study.query.get_or_404(study_id)
-    check_current_authorized(study)
+    study = get_authorized_study(study_id)
 
     if not study.active:
-        return answer_info(study_id)
+        return redirect_to_answer_info(study_id)
 
     current_app.logger.info(
         "Attempting to rename cfmm2tar output %s",
@@ -822,7 +1003,7 @@ def rename_cfmm2tar(study_id: int, cfmm2tar_id: int) -> str:
     cfmm2tar_output.tar_file = new_name
     db.session.commit()  # pyright: ignore
 
-    return answer_info(study_id)
+    return redirect_to_answer_info(study_id)
 
 
 @portal_blueprint.route(
@@ -830,7 +1011,7 @@ def rename_cfmm2tar(study_id: int, cfmm2tar_id: int) -> str:
     methods=["GET"],
 )
 @login_required
-def archive_tar2bids(study_id: int) -> str:
+def archive_tar2bids(study_id: int) -> Response:
     """Archive a study's BIDS directory.
 
     Parameters
@@ -840,24 +1021,20 @@ def archive_tar2bids(study_id: int) -> str:
 
     Returns
     -------
-    str
-        Render page with survey response based on study id
+    Response
+        Redirect to the study's answer_info page
     """
-    study = Study.query.get_or_404(study_id)
-    check_current_authorized(study)
+    study = get_authorized_study(study_id)
 
     if not study.active:
-        return answer_info(study_id)
-
-    if (
-        len(
-            Task.query.filter_by(
-                study_id=study_id,
-                complete=False,
-            ).all(),
-        )
-        > 0
-    ):
+        return redirect_to_answer_info(study_id)
+
+    if db.session.query(  # pyright: ignore
+        Task.query.filter_by(
+            study_id=study_id,
+            complete=False,
+        ).exists(),
+    ).scalar():
         flash("An task is currently in progress for this study.")
     else:
         Task.launch_task(
@@ -874,7 +1051,7 @@ def archive_tar2bids(study_id: int) -> str:
         )
         db.session.commit()  # pyright: ignore
 
-    return answer_info(study_id)
+    return redirect_to_answer_info(study_id)
 
 
 @portal_blueprint.route(
@@ -883,7 +1060,7 @@ def archive_tar2bids(study_id: int) -> str:
 )
 @portal_blueprint.route("/results/<int:study_id>/tar2bids", methods=["DELETE"])
 @login_required
-def delete_tar2bids(study_id: int) -> str:
+def delete_tar2bids(study_id: int) -> Response:
     """Delete a study's BIDS directory.
 
     Parameters
@@ -893,14 +1070,13 @@ def delete_tar2bids(study_id: int) -> str:
 
     Returns
     -------
-    str
-        Render page with survey response based on study id
+    Response
+        Redirect to the study's answer_info page
     """
-    study = Study.query.get_or_404(study_id)
-    check_current_authorized(study)
+    study = get_authorized_study(study_id)
 
     if not study.active:
-        return answer_info(study_id)
+        return redirect_to_answer_info(study_id)
 
     dataset = DataladDataset.query.filter_by(
         study_id=study_id,
@@ -920,8 +1096,9 @@ def delete_tar2bids(study_id: int) -> str:
         dataset.cfmm2tar_outputs = []
 
         # Delete archives from db
-        for archive in dataset.dataset_archives:
-            db.session.delete(archive)  # pyright: ignore
+        DatasetArchive.query.filter_by(dataset_id=dataset.id).delete(
+            synchronize_session=False,
+        )
 
         # Delete all zip files
         remove_zip_files(
@@ -932,12 +1109,12 @@ def delete_tar2bids(study_id: int) -> str:
 
         db.session.commit()  # pyright: ignore
 
-    return answer_info(study_id)
+    return redirect_to_answer_info(study_id)
 
 
 @portal_blueprint.route("/results/<int:study_id>/tar2bids", methods=["POST"])
 @login_required
-def run_tar2bids(study_id: int) -> str:
+def run_tar2bids(study_id: int) -> Response:
     """Launch tar2bids task and refresh answer_info.html.
 
     Parameters
@@ -947,14 +1124,13 @@ def run_tar2bids(study_id: int) -> str:
 
     Returns
     -------
-    str
-        Render page with survey response based on study id
+    Response
+        Redirect to the study's answer_info page
     """
-    study = Study.query.get_or_404(study_id)
-    check_current_authorized(study)
+    study = get_authorized_study(study_id)
 
     if not study.active:
-        return answer_info(study_id)
+        return redirect_to_answer_info(study_id)
 
     form = Tar2bidsRunForm()
     tar_files = [
@@ -965,16 +1141,13 @@ def run_tar2bids(study_id: int) -> str:
         tar_file for tar_file in tar_files if tar_file.study_id == study_id
     ]
 
-    if (
-        len(
-            Task.query.filter_by(
-                study_id=study_id,
-                name="run_tar2bids",
-                complete=False,
-            ).all(),
-        )
-        > 0
-    ):
+    if db.session.query(  # pyright: ignore
+        Task.query.filter_by(
+            study_id=study_id,
+            name="run_tar2bids",
+            complete=False,
+        ).exists(),
+    ).scalar():
         flash("An tar2bids run is currently in progress")
     else:
         Task.launch_task(
@@ -993,47 +1166,7 @@ def run_tar2bids(study_id: int) -> str:
         )
         db.session.commit()  # pyright: ignore
 
-    return answer_info(study_id)
-
-
-def update_scanner(scanner: str) -> str:
-    """Parse scanner data into something readable.
-
-    Parameters
-    ----------
-    scanner
-        Type of scanner data
-
-    Returns
-    -------
-    str
-        Field strength of scanner, one of [3T, 7T]
-    """
-    return "3T" if scanner == "type1" else "7T"
-
-
-def update_familiarity(familiarity: str) -> str:
-    """Parse familiarity value into human-readable description.
-
-    Parameters
-    ----------
-    familiarity
-        String representation of integer value for familiarity
-
-    Returns
-    -------
-    str
-        String representation of familiarity
-    """
-    familiarity_map = {
-        "1": "Not familiar at all",
-        "2": "Have heard of it",
-        "3": "Have used it before",
-        "4": "Used it regularly",
-        "5": "I consider myself an expert",
-    }
-
-    return familiarity_map[familiarity]
+    return redirect_to_answer_info(study_id)
 
 
 def update_date(date):
@@ -1041,42 +1174,29 @@ def update_date(date):
     return date.date() if date is not None else date
 
 
-def update_bool(bool_str: str) -> str:
-    """Parse boolean int string into Yes/No.
-
-    Parameters
-    ----------
-    bool_str
-        String representation ('0' or '1') of boolean response
-
-    Returns
-    -------
-    str
-        'Yes' or 'No' depending on boolean input
-    """
-    return "Yes" if bool_str == "1" else "No"
-
-
 @portal_blueprint.route("/results/download", methods=["GET"])
 @login_required
 def download() -> Response:
     """Download csv containing all the survey response.
 
+    Rows are streamed to the client as they are read from the database,
+    rather than building the whole report in memory first.
+
     Returns
     -------
     Response
-        Object containing generated excel data
+        Streaming response containing the CSV report
     """
-    response_list = (
-        Study.query.all()
-        if current_user.admin  # pyright: ignore
-        else current_user.studies  # pyright: ignore
-    )
+    query = Study.query.options(lazyload(Study.users_authorized))
+    if not current_user.admin:  # pyright: ignore
+        query = query.join(Study.users_authorized).filter(
+            User.id == current_user.id,  # pyright: ignore
+        )
     file_name = "Response_report"
 
-    csv_list = [
-        [file_name],
-        [
+    def gen_rows():
+        yield [file_name]
+        yield [
             "Submitter Name",
             "Submitter Email",
             "Status",
@@ -1100,44 +1220,49 @@ def download() -> Response:
             "Retrospective Data End Date",
             "Consent",
             "Comment",
-        ],
-    ]
-
-    for response in response_list:
-        csv_list.append(
-            [
+        ]
+        for response in query.yield_per(DOWNLOAD_BATCH_SIZE):
+            yield [
                 response.submitter_name,
                 response.submitter_email,
                 response.status.capitalize(),
-                update_scanner(response.scanner),
+                SCANNER_LABELS.get(response.scanner, "7T"),
                 response.scan_number,
-                update_bool(response.study_type),
-                update_familiarity(response.familiarity_bids),
-                update_familiarity(response.familiarity_bidsapp),
-                update_familiarity(response.familiarity_python),
-                update_familiarity(response.familiarity_linux),
-                update_familiarity(response.familiarity_bash),
-                update_familiarity(response.familiarity_hpc),
-                update_familiarity(response.familiarity_openneuro),
-                update_familiarity(response.familiarity_cbrain),
+                BOOL_LABELS[response.study_type],
+                FAMILIARITY_LABELS[response.familiarity_bids],
+                FAMILIARITY_LABELS[response.familiarity_bidsapp],
+                FAMILIARITY_LABELS[response.familiarity_python],
+                FAMILIARITY_LABELS[response.familiarity_linux],
+                FAMILIARITY_LABELS[response.familiarity_bash],
+                FAMILIARITY_LABELS[response.familiarity_hpc],
+                FAMILIARITY_LABELS[response.familiarity_openneuro],
+                FAMILIARITY_LABELS[response.familiarity_cbrain],
                 response.principal,
                 response.project_name,
                 response.dataset_name,
                 update_date(response.sample),
-                update_bool(response.retrospective_data),
+                BOOL_LABELS[response.retrospective_data],
                 update_date(response.retrospective_start),
                 update_date(response.retrospective_end),
-                update_bool(response.consent),
+                BOOL_LABELS[response.consent],
                 response.comment,
-            ],
-        )
-
-    # Type hinted to return (Unknown | None), but docstring suggests
-    # return type should be Response
-    return excel.make_response_from_array(  # pyright: ignore
-        csv_list,
-        "csv",
-        file_name=file_name,
+            ]
+
+    def gen_csv():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in gen_rows():
+            writer.writerow(row)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    return Response(
+        stream_with_context(gen_csv()),
+        mimetype="text/csv",
+        headers={
+            "Content-Disposition": f"attachment; filename={file_name}.csv",
+        },
     )
 
 
@@ -1160,8 +1285,7 @@ def process_dicom_form(study_id: int) -> str | NoReturn:
         If excluded UIDs are to be updated or cfmm2tar is to be launched,
         otherwise cancel if study not found
     """
-    study = Study.query.get_or_404(study_id)
-    check_current_authorized(study)
+    get_authorized_study(study_id)
 
     if "update-exclusions" in request.form:
         return update_exclusions(study_id)
@@ -1174,7 +1298,7 @@ def process_dicom_form(study_id: int) -> str | NoReturn:
 
 @portal_blueprint.route("results/<int:study_id>/exclusions", methods=["POST"])
 @login_required
-def update_exclusions(study_id: int) -> str:
+def update_exclusions(study_id: int) -> Response:
     """Update the excluded UIDs for a study.
 
     Parameters
@@ -1184,40 +1308,53 @@ def update_exclusions(study_id: int) -> str:
 
     Returns
     -------
-    str
-        Returns all dicoms associated with study id
+    Response
+        Redirect to the study's matching DICOM scans
     """
-    study = Study.query.get_or_404(study_id)
-    check_current_authorized(study)
+    study = get_authorized_study(study_id)
 
-    # Participants to be excluded
+    # Participants to be excluded, replacing any existing explicit entry
     form_exclude = ExcludeScansForm()
-    for val_json in form_exclude.choices_to_exclude.data:  # pyright: ignore
-        val = loads(loads(val_json))
-        old_uid = ExplicitPatient.query.filter_by(
-            study_instance_uid=val["StudyInstanceUID"],
-        ).one_or_none()
-        if old_uid is not None:
-            db.session.delete(old_uid)  # pyright: ignore
-
-        excluded_uid = ExplicitPatient(
-            study_id=study.id,
-            study_instance_uid=val["StudyInstanceUID"],
-            patient_name=val["PatientName"],
-            dicom_study_id=val["StudyID"],
-            included=False,
-        )
-        db.session.add(excluded_uid)  # pyright: ignore
-        db.session.commit()  # pyright: ignore
+    to_exclude = form_exclude.choices_to_exclude.data or []
+    if to_exclude:
+        ExplicitPatient.query.filter(
+            ExplicitPatient.study_instance_uid.in_(
+                [val["StudyInstanceUID"] for val in to_exclude],
+            ),
+        ).delete(synchronize_session=False)
+    db.session.add_all(  # pyright: ignore
+        [
+            ExplicitPatient(
+                study_id=study.id,
+                study_instance_uid=val["StudyInstanceUID"],
+                patient_name=val["PatientName"],
+                dicom_study_id=val["StudyID"],
+                included=False,
+            )
+            for val in to_exclude
+        ],
+    )
 
-    # Participants to be included
+    # Participants to be included, stopping at the first one that already
+    # has an explicit entry
     form_include = IncludeScansForm()
-    for val_json in form_include.choices_to_include.data:  # pyright: ignore
-        val = loads(loads(val_json))
-        old_uid = ExplicitPatient.query.filter_by(
-            study_instance_uid=val["StudyInstanceUID"],
-        ).one_or_none()
-        if old_uid is not None:
+    to_include = form_include.choices_to_include.data or []
+    existing_uids = (
+        {
+            uid
+            for (uid,) in db.session.query(  # pyright: ignore
+                ExplicitPatient.study_instance_uid,
+            ).filter(
+                ExplicitPatient.study_instance_uid.in_(
+                    [val["StudyInstanceUID"] for val in to_include],
+                ),
+            )
+        }
+        if to_include
+        else set()
+    )
+    for val in to_include:
+        if val["StudyInstanceUID"] in existing_uids:
             break
         included_uid = ExplicitPatient(
             study_id=study.id,
@@ -1227,9 +1364,17 @@ def update_exclusions(study_id: int) -> str:
             included=True,
         )
         db.session.add(included_uid)  # pyright: ignore
-        db.session.commit()  # pyright: ignore
 
-    return dicom_verify(study_id, "description")
+    db.session.commit()  # pyright: ignore
+
+    return redirect(
+        url_for(
+            "portal_blueprint.dicom_verify",
+            study_id=study_id,
+            method="description",
+        ),
+        code=303,
+    )
 
 
 @portal_blueprint.route(
@@ -1253,8 +1398,7 @@ def dicom_verify(study_id: int, method: str):
     str
         Renders page with DICOM results for a given study
     """
-    study = Study.query.get_or_404(study_id)
-    check_current_authorized(study)
+    study = get_authorized_study(study_id)
 
     study_info = f"{study.principal}^{study.project_name}"
 
@@ -1299,38 +1443,27 @@ def dicom_verify(study_id: int, method: str):
         )
 
     # Generate forms for patient exclusion / inclusion, sorted by name
-    sorted_responses = sorted(
-        responses,
-        key=lambda attr_dict: f'{attr_dict["PatientName"]}',
-    )
-    form_exclude = ExcludeScansForm()
-    form_exclude.choices_to_exclude.choices = [
-        (
-            dumps(
-                {
-                    "StudyInstanceUID": response["StudyInstanceUID"],
-                    "PatientName": response["PatientName"],
-                    "StudyID": response["StudyID"],
-                },
-            ),
-            "Exclude",
+    sorted_responses = sorted(responses, key=itemgetter("PatientName"))
+    # The exclude and include checkboxes submit the same value per study, so
+    # encode each one once
+    encoded_responses = [
+        dumps(
+            {
+                "StudyInstanceUID": response["StudyInstanceUID"],
+                "PatientName": response["PatientName"],
+                "StudyID": response["StudyID"],
+            },
         )
         for response in sorted_responses
     ]
+    form_exclude = ExcludeScansForm()
+    form_exclude.choices_to_exclude.choices = [
+        (encoded, "Exclude") for encoded in encoded_responses
+    ]
 
     form_include = IncludeScansForm()
     form_include.choices_to_include.choices = [
-        (
-            dumps(
-                {
-                    "StudyInstanceUID": response["StudyInstanceUID"],
-                    "PatientName": response["PatientName"],
-                    "StudyID": response["StudyID"],
-                },
-            ),
-            "Include",
-        )
-        for response in responses
+        (encoded, "Include") for encoded in encoded_responses
     ]
 
     # Generate form to run cfmm2tar
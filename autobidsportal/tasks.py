@@ -14,6 +14,8 @@ from zipfile import ZipFile
 from bids import BIDSLayout
 from datalad.support.gitrepo import GitRepo
 from rq.job import get_current_job
+from sqlalchemy import func, update
+from sqlalchemy.pool import NullPool
 
 from autobidsportal.app import create_app
 from autobidsportal.apptainer import apptainer_exec
@@ -35,7 +37,7 @@ from autobidsportal.dcm4cheutils import (
     Tar2bidsError,
     gen_utils,
 )
-from autobidsportal.dicom import get_study_records
+from autobidsportal.dicom import clear_cached_responses, get_study_records
 from autobidsportal.email import send_email
 from autobidsportal.filesystem import gen_dir_dict, render_dir_dict
 from autobidsportal.models import (
@@ -51,12 +53,22 @@ from autobidsportal.models import (
 )
 from autobidsportal.ssh import copy_file, make_remote_dir
 
-app = create_app()
+# Workers hold the app for the length of long subprocess runs, so don't keep
+# pooled connections around that could go stale in the meantime.
+app = create_app(
+    override_dict={"SQLALCHEMY_ENGINE_OPTIONS": {"poolclass": NullPool}},
+)
 app.app_context().push()
 
 COMPLETION_PROGRESS = 100
 MAX_CFMM2TAR_ATTEMPTS = 5
 
+# Matches a cfmm2tar tar file name, capturing the year, month, and day of its
+# YYYYMMDD date
+TAR_FILE_RE = re.compile(
+    r"[a-zA-Z]+_[\w\-]+_(\d{4})(\d{2})(\d{2})_[\w\-]+_[\.a-zA-Z\d]+\.tar",
+)
+
 
 def _set_task_progress(progress: int):
     """Set progress of current task.
@@ -73,19 +85,29 @@ def _set_task_progress(progress: int):
 
     job.meta["progress"] = progress
     job.save_meta()
-    task = Task.query.get(job.id)
-    if task.user is not None:
-        task.user.add_notification(
+    user = (
+        User.query.join(Task, Task.user_id == User.id)
+        .filter(Task.id == job.id)
+        .one_or_none()
+    )
+    if user is not None:
+        user.add_notification(
             "task_progress",
             {"task_id": job.id, "progress": progress},
         )
 
     # If task completed
     if progress == COMPLETION_PROGRESS:
-        task.complete = True
-        task.success = True
-        task.error = None
-        task.end_time = datetime.now(tz=TIME_ZONE)
+        db.session.execute(  # pyright: ignore
+            update(Task)
+            .where(Task.id == job.id)
+            .values(
+                complete=True,
+                success=True,
+                error=None,
+                end_time=datetime.now(tz=TIME_ZONE),
+            ),
+        )
 
     db.session.commit()  # pyright: ignore
 
@@ -102,31 +124,45 @@ def _set_task_error(msg: str):
     if not (job := get_current_job()):
         return
 
-    task = Task.query.get(job.id)
-    task.complete = True
-    task.success = False
-    task.error = msg[:128] if msg else ""
-    task.end_time = datetime.now(tz=TIME_ZONE)
+    db.session.execute(  # pyright: ignore
+        update(Task)
+        .where(Task.id == job.id)
+        .values(
+            complete=True,
+            success=False,
+            error=msg[:128] if msg else "",
+            end_time=datetime.now(tz=TIME_ZONE),
+        ),
+    )
 
     db.session.commit()  # pyright: ignore
 
 
-def _append_task_log(log: str):
+def _append_task_log(log: str, *, commit: bool = True):
     """Append to task log.
 
     Parameters
     ----------
     log
         Message to append to log of task
+
+    commit
+        Whether to commit immediately. Pass False when the caller commits
+        soon after anyway, so several updates share one commit.
     """
     # If no jobs in progress
     if not (job := get_current_job()):
         return
 
-    task = Task.query.get(job.id)
-    task.log = "".join([task.log if task.log is not None else "", log])
+    # Append in the database rather than rewriting the whole log each time
+    db.session.execute(  # pyright: ignore
+        update(Task)
+        .where(Task.id == job.id)
+        .values(log=func.coalesce(Task.log, "") + log),
+    )
 
-    db.session.commit()  # pyright: ignore
+    if commit:
+        db.session.commit()  # pyright: ignore
 
 
 def run_cfmm2tar_with_retries(
@@ -185,6 +221,9 @@ def record_cfmm2tar(
 ):
     """Parse cfmm2tar output files and record them in the db.
 
+    Cached DICOM query responses are dropped afterwards, since they predate
+    the download.
+
     Parameters
     ----------
     tar_file
@@ -204,29 +243,22 @@ def record_cfmm2tar(
     Cfmm2tarError
         If cfmm2tar fails.
     """
-    date_match = re.fullmatch(
-        r"[a-zA-Z]+_[\w\-]+_(\d{8})_[\w\-]+_[\.a-zA-Z\d]+\.tar",
-        tar_file,
-    )
+    date_match = TAR_FILE_RE.fullmatch(tar_file)
     if not date_match:
         msg = f"Output {tar_file} could not be parsed."
         raise Cfmm2tarError(msg)
 
-    date_match = date_match.group(1)
+    year, month, day = map(int, date_match.groups())
     cfmm2tar = Cfmm2tarOutput(
         study_id=study_id,
         tar_file=tar_file,
         uid=uid.strip(),
-        date=datetime(
-            int(date_match[0:4]),
-            int(date_match[4:6]),
-            int(date_match[6:8]),
-            tzinfo=TIME_ZONE,
-        ),
+        date=datetime(year, month, day, tzinfo=TIME_ZONE),
         attached_tar_file=attached_tar_file,
     )
     db.session.add(cfmm2tar)  # pyright: ignore
     db.session.commit()  # pyright: ignore
+    clear_cached_responses()
 
 
 def process_uid_file(uid_path: PathLike[str] | str) -> str:
@@ -274,20 +306,24 @@ def find_studies_to_download(
         List of studies if explicit scans are provided or list of study
         records matching study_description
     """
-    existing_outputs = Cfmm2tarOutput.query.filter_by(study_id=study.id).all()
-    if explicit_scans is not None:
-        return [
-            scan
-            for scan in explicit_scans
-            if scan["StudyInstanceUID"]
-            not in {output.uid.strip() for output in existing_outputs}
-        ]
+    existing_uids = {
+        uid.strip()
+        for (uid,) in db.session.query(  # pyright: ignore
+            Cfmm2tarOutput.uid,
+        ).filter(
+            Cfmm2tarOutput.study_id == study.id,
+        )
+    }
+    candidates = (
+        explicit_scans
+        if explicit_scans is not None
+        else get_study_records(study, description=study_description)
+    )
 
     return [
-        record
-        for record in get_study_records(study, description=study_description)
-        if record["StudyInstanceUID"]
-        not in {output.uid.strip() for output in existing_outputs}
+        candidate
+        for candidate in candidates
+        if candidate["StudyInstanceUID"] not in existing_uids
     ]
 
 
@@ -403,6 +439,7 @@ def handle_cfmm2tar(
         target["StudyInstanceUID"],
     )
 
+    # Commit now rather than holding the task row through the dataset copy
     _append_task_log(log)
     app.logger.info(
         "Successfully ran cfmm2tar for target %s.",
@@ -438,6 +475,7 @@ def handle_cfmm2tar(
         msg = "No uid file produced."
         raise Cfmm2tarError(msg)
 
+    app.logger.info("tmp contents: %s", created_files)
     created_files = list(set(created_files) - {uid_file})
     uid = process_uid_file(uid_file)
 
@@ -448,10 +486,6 @@ def handle_cfmm2tar(
     ) as path_dataset:
         for file_ in created_files:
             app.logger.info("file_: %s", file_)
-            app.logger.info(
-                "tmp contents: %s",
-                list(pathlib.Path(file_.parent).iterdir()),
-            )
             app.logger.info("path_dataset: %s", path_dataset)
 
             # If a "new" tar file already exists in dataset, copying will fail
@@ -608,8 +642,15 @@ def run_tar2bids(study_id: int, tar_file_ids: Sequence[int]):
     """
     _set_task_progress(0)
     study = Study.query.get(study_id)
+    # Fetch every output in one query, keeping the requested order
+    outputs_by_id = {
+        output.id: output
+        for output in Cfmm2tarOutput.query.filter(
+            Cfmm2tarOutput.id.in_(tar_file_ids),
+        )
+    }
     cfmm2tar_outputs = [
-        Cfmm2tarOutput.query.get(tar_file_id) for tar_file_id in tar_file_ids
+        outputs_by_id[tar_file_id] for tar_file_id in tar_file_ids
     ]
     dataset_tar = ensure_dataset_exists(study_id, DatasetType.SOURCE_DATA)
     dataset_bids = ensure_dataset_exists(study_id, DatasetType.RAW_DATA)
@@ -659,13 +700,9 @@ def run_tar2bids(study_id: int, tar_file_ids: Sequence[int]):
                     )
                 except Tar2bidsError as err:
                     app.logger.exception("tar2bids failed")
-                    _set_task_error(
-                        err.__cause__.stderr  # pyright: ignore
-                        if err.__cause__ is not None
-                        else str(err),
-                    )
-                    _append_task_log(str(err))
-                    _append_task_log("Dataset contents:\n")
+                    # Record the logs and error together in one commit
+                    _append_task_log(str(err), commit=False)
+                    _append_task_log("Dataset contents:\n", commit=False)
                     _append_task_log(
                         "\n".join(
                             render_dir_dict(
@@ -675,6 +712,12 @@ def run_tar2bids(study_id: int, tar_file_ids: Sequence[int]):
                                 ),
                             ),
                         ),
+                        commit=False,
+                    )
+                    _set_task_error(
+                        err.__cause__.stderr  # pyright: ignore
+                        if err.__cause__ is not None
+                        else str(err),
                     )
                     send_email(
                         "Failed tar2bids run",
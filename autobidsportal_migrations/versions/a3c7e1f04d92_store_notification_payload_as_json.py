@@ -0,0 +1,40 @@
+"""Store notification payload as JSON
+
+Revision ID: a3c7e1f04d92
+Revises: 5b1d9e3a7c20
+Create Date: 2026-10-15 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "a3c7e1f04d92"
+down_revision = "5b1d9e3a7c20"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("notification", schema=None) as batch_op:
+        batch_op.alter_column(
+            "payload_json",
+            new_column_name="payload",
+            existing_type=sa.Text(),
+            type_=sa.JSON(),
+            postgresql_using="payload_json::json",
+            existing_nullable=False,
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("notification", schema=None) as batch_op:
+        batch_op.alter_column(
+            "payload",
+            new_column_name="payload_json",
+            existing_type=sa.JSON(),
+            type_=sa.Text(),
+            postgresql_using="payload::text",
+            existing_nullable=False,
+        )
@@ -1,8 +1,12 @@
 """Flask entry point with extra CLI commands."""
+from __future__ import annotations
+
+from collections.abc import Sequence
 
 from autobidsportal.app import create_app
 from autobidsportal.dcm4cheutils import Dcm4cheError, gen_utils
 from autobidsportal.models import (
+    PRINCIPAL_VERSION_KEY,
     Cfmm2tarOutput,
     DataladDataset,
     DatasetType,
@@ -15,10 +19,72 @@ from autobidsportal.models import (
     User,
     db,
 )
-from autobidsportal.tasks import update_heuristics
 
 app = create_app()
 
+# Maximum number of jobs shipped to redis in a single pipeline
+ENQUEUE_BATCH_SIZE = 1000
+
+# Number of study rows fetched per round trip when iterating active studies
+ACTIVE_STUDY_BATCH_SIZE = 200
+
+
+def get_busy_study_ids(task_name: str) -> set[int]:
+    """Get the IDs of all studies with an incomplete task of a given name.
+
+    Parameters
+    ----------
+    task_name
+        Name of the task to check for
+
+    Returns
+    -------
+    set[int]
+        IDs of studies with the named task in progress
+    """
+    return {
+        row.study_id
+        for row in db.session.query(Task.study_id)
+        .filter(Task.name == task_name, Task.complete.is_(False))
+        .distinct()
+    }
+
+
+def active_study_ids():
+    """Build a query streaming the IDs of all active studies.
+
+    Returns
+    -------
+    Query
+        Query yielding one ``(study_id,)`` row per active study
+    """
+    return (
+        db.session.query(Study.id)
+        .filter(Study.active.is_(True))
+        .yield_per(ACTIVE_STUDY_BATCH_SIZE)
+    )
+
+
+def enqueue_for_studies(func: str, study_ids: Sequence[int]):
+    """Enqueue one job per study, pipelining the redis commands.
+
+    Parameters
+    ----------
+    func
+        Import path of the task function to enqueue
+
+    study_ids
+        IDs of the studies to enqueue a job for
+    """
+    task_queue = app.task_queue
+    for start in range(0, len(study_ids), ENQUEUE_BATCH_SIZE):
+        task_queue.enqueue_many(
+            [
+                task_queue.prepare_data(func, (study_id,))
+                for study_id in study_ids[start : start + ENQUEUE_BATCH_SIZE]
+            ],
+        )
+
 
 @app.shell_context_processor
 def make_shell_context():
@@ -39,15 +105,29 @@ def make_shell_context():
 @app.cli.command()
 def check_pis():
     """Add a list of pi names from dicom server to the Principal table."""
+    from redis.exceptions import RedisError
+
     try:
         principal_names = gen_utils().get_all_pi_names()
+        # Swap the list in one transaction so the web app never caches a
+        # partially refreshed set of PIs
         db.session.query(Principal).delete()
-        for principal_name in principal_names:
-            principal = Principal(principal_name=principal_name)
-            db.session.add(principal)
-            db.session.commit()
+        db.session.add_all(
+            [
+                Principal(principal_name=principal_name)
+                for principal_name in principal_names
+            ],
+        )
+        db.session.commit()
     except Dcm4cheError as err:
         print(err)
+        return "Success"
+
+    try:
+        # Tell processes caching the old PI list to reload it
+        app.redis.incr(PRINCIPAL_VERSION_KEY)
+    except RedisError as err:
+        print(f"Could not bump the PI list version: {err}")
     return "Success"
 
 
@@ -57,6 +137,10 @@ def run_update_heuristics():
 
     The point of this wrapper function is to expose the task to the CLI.
     """
+    # autobidsportal.tasks builds its own app on import, so only import it
+    # when it is actually needed rather than on every web/CLI startup.
+    from autobidsportal.tasks import update_heuristics
+
     update_heuristics()
 
 
@@ -67,45 +151,30 @@ def run_all_cfmm2tar():
     This won't run cfmm2tar on studies that currently have cfmm2tar runs in
     progress.
     """
-    for study in Study.query.all():
-        if (
-            len(
-                Task.query.filter_by(
-                    study_id=study.id,
-                    name="run_cfmm2tar",
-                    complete=False,
-                ).all(),
-            )
-            > 0
-        ) or (not study.active):
-            print(f"Skipping study {study.id}. Active: {study.active}")
+    busy_ids = get_busy_study_ids("run_cfmm2tar")
+    study_ids = []
+    for (study_id,) in active_study_ids():
+        if study_id in busy_ids:
+            print(f"Skipping study {study_id}. Task in progress.")
             continue
-        app.task_queue.enqueue(
-            "autobidsportal.tasks.check_tar_files",
-            study.id,
-        )
+        study_ids.append(study_id)
+    enqueue_for_studies("autobidsportal.tasks.check_tar_files", study_ids)
 
 
 @app.cli.command()
 def run_all_tar2bids():
     """Run tar2bids on all active studies."""
-    for study in Study.query.all():
-        if (
-            len(
-                Task.query.filter_by(
-                    study_id=study.id,
-                    name="run_tar2bids",
-                    complete=False,
-                ).all(),
-            )
-            > 0
-        ) or not study.active:
-            print(f"Skipping study {study.id}. Active: {study.active}")
+    busy_ids = get_busy_study_ids("run_tar2bids")
+    study_ids = []
+    for (study_id,) in active_study_ids():
+        if study_id in busy_ids:
+            print(f"Skipping study {study_id}. Task in progress.")
             continue
-        app.task_queue.enqueue(
-            "autobidsportal.tasks.find_unprocessed_tar_files",
-            study.id,
-        )
+        study_ids.append(study_id)
+    enqueue_for_studies(
+        "autobidsportal.tasks.find_unprocessed_tar_files",
+        study_ids,
+    )
 
 
 @app.cli.command()
@@ -115,23 +184,17 @@ def run_all_archive():
     This won't archive studies that currently have tar2bids runs in
     progress.
     """
-    for study in Study.query.all():
-        if (
-            len(
-                Task.query.filter_by(
-                    study_id=study.id,
-                    name="get_info_from_tar2bids",
-                    complete=False,
-                ).all(),
-            )
-            > 0
-        ) or (not study.active):
-            continue
-        Task.launch_task(
+    busy_ids = get_busy_study_ids("get_info_from_tar2bids")
+    study_ids = [
+        study_id
+        for (study_id,) in active_study_ids()
+        if study_id not in busy_ids
+    ]
+    for start in range(0, len(study_ids), ENQUEUE_BATCH_SIZE):
+        Task.launch_study_tasks(
             "archive_raw_data",
             "automatic archive task",
-            study.id,
-            study_id=study.id,
+            study_ids[start : start + ENQUEUE_BATCH_SIZE],
             timeout=app.config["ARCHIVE_TIMEOUT"],
         )
 
@@ -143,19 +206,17 @@ def run_all_archive_derivative():
     This won't archive studies that currently have tar2bids runs in
     progress.
     """
-    for study in Study.query.all():
-        if (
-            not DataladDataset.query.filter_by(
-                study_id=study.id,
-                dataset_type=DatasetType.DERIVED_DATA,
-            ).one_or_none()
-        ) or (not study.active):
-            continue
-        Task.launch_task(
+    derived_study_ids = (
+        active_study_ids()
+        .join(DataladDataset, DataladDataset.study_id == Study.id)
+        .filter(DataladDataset.dataset_type == DatasetType.DERIVED_DATA)
+    )
+    study_ids = [study_id for (study_id,) in derived_study_ids]
+    for start in range(0, len(study_ids), ENQUEUE_BATCH_SIZE):
+        Task.launch_study_tasks(
             "archive_derivative_data",
             "automatic archive task",
-            study.id,
-            study_id=study.id,
+            study_ids[start : start + ENQUEUE_BATCH_SIZE],
             timeout=app.config["ARCHIVE_TIMEOUT"],
         )
 
@@ -163,24 +224,12 @@ def run_all_archive_derivative():
 @app.cli.command()
 def run_all_gradcorrect():
     """Run gradcorrect on all active studies."""
-    for study in Study.query.all():
-        if (
-            (study.scanner != "type2")
-            or (
-                len(
-                    Task.query.filter_by(
-                        study_id=study.id,
-                        name="gradcorrect_study",
-                        complete=False,
-                    ).all(),
-                )
-                > 0
-            )
-            or not study.active
-        ):
-            print(f"Skipping study {study.id}. Active: {study.active}")
+    busy_ids = get_busy_study_ids("gradcorrect_study")
+    for (study_id,) in active_study_ids().filter(Study.scanner == "type2"):
+        if study_id in busy_ids:
+            print(f"Skipping study {study_id}. Task in progress.")
             continue
         app.task_queue.enqueue(
             "autobidsportal.tasks.find_uncorrected_images",
-            study.id,
+            study_id,
         )
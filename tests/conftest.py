@@ -1,6 +1,7 @@
 """Test fixtures."""
 
 from dataclasses import dataclass
+from fnmatch import fnmatchcase
 import tempfile
 import pathlib
 import datetime
@@ -46,7 +47,13 @@ class TestConfig:
 
 
 @pytest.fixture()
-def test_client():
+def config_overrides():
+    """Extra config for test_client; parametrize this to change it."""
+    return {}
+
+
+@pytest.fixture()
+def test_client(config_overrides):
     """Make an app with the test config and yield a test client."""
 
     with tempfile.NamedTemporaryFile() as db_file:
@@ -61,6 +68,7 @@ def test_client():
                     "HEURISTIC_REPO_PATH": str(heuristic_dir_base),
                     "HEURISTIC_DIR_PATH": "heuristics",
                     "TAR2BIDS_DOWNLOAD_DIR": str(heuristic_dir_base),
+                    **config_overrides,
                 },
             )
             with app.test_client() as testing_client:
@@ -68,6 +76,47 @@ def test_client():
                     yield testing_client
 
 
+class FakeRedis:
+    """Dict-backed stand-in for the redis commands the app uses."""
+
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    def setex(self, key, _timeout, value):
+        self.data[key] = value
+
+    def incr(self, key):
+        self.data[key] = str(int(self.data.get(key, 0)) + 1)
+        return int(self.data[key])
+
+    def scan_iter(self, match="*"):
+        return [key for key in self.data if fnmatchcase(key, match)]
+
+    def delete(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def pipeline(self):
+        # Commands apply immediately, so there is nothing to batch
+        return self
+
+    def execute(self):
+        return []
+
+
+@pytest.fixture()
+def fake_redis(test_client):
+    """Replace the app's redis connection with an in-memory fake."""
+    redis = FakeRedis()
+    test_client.application.redis = redis
+    return redis
+
+
 @pytest.fixture()
 def new_user():
     """Make a user that can be added to the db."""
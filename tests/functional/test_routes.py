@@ -1,5 +1,21 @@
 """Test route responses with the test client."""
 
+import csv
+import io
+
+import pytest
+from sqlalchemy import event
+
+from autobidsportal.models import (
+    PRINCIPAL_VERSION_KEY,
+    ExplicitPatient,
+    Principal,
+    User,
+    accessible_studies,
+    db,
+)
+from autobidsportal.routes import get_principal_names
+
 
 def _assert_splash(data):
     assert b"Welcome to Autobids!" in data
@@ -316,6 +332,35 @@ def test_results_download(test_client, init_database, login_normal_user):
     assert response.status_code == 200
 
 
+def test_results_download_rows(test_client, example_study, login_admin):
+    """Test that the CSV report lists each study with readable answers."""
+    response = test_client.get("/results/download")
+    assert response.status_code == 200
+    assert response.mimetype == "text/csv"
+
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    assert rows[0] == ["Response_report"]
+    assert rows[1][:6] == [
+        "Submitter Name",
+        "Submitter Email",
+        "Status",
+        "Scanner",
+        "Number of Scans",
+        "Study Type",
+    ]
+    assert rows[1][-1] == "Comment"
+    assert len(rows) == 3
+    study = dict(zip(rows[1], rows[2]))
+    assert study["Submitter Email"] == "test@test.com"
+    assert study["Status"] == "Staff"
+    assert study["Scanner"] == "3T"
+    assert study["Study Type"] == "No"
+    assert study["Bids Familiarity"] == "Not familiar at all"
+    assert study["Sample Date"] == "2004-08-26"
+    assert study["Retrospective Data"] == "No"
+    assert study["Consent"] == "Yes"
+
+
 def test_complete_survey_access_study_info(test_client, login_admin):
     """Test that a survey's results are viewable."""
     response = test_client.post(
@@ -377,6 +422,112 @@ def test_complete_survey_access_study_info(test_client, login_admin):
     assert b"*_{subject}" in response.data
 
 
+def test_study_access_checked_without_loading_users(
+    test_client, example_study
+):
+    """Test that a non-admin's study access is checked with EXISTS."""
+    credentials = {"email": "johnsmith@gmail.com", "password": "Password123"}
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    test_client.post("/login", data=credentials)
+    event.listen(db.engine, "before_cursor_execute", record)
+    try:
+        response = test_client.get("/results/1/demographics")
+        assert response.status_code == 404
+        test_client.get("/logout")
+
+        db.session.execute(
+            accessible_studies.insert().values(
+                study_id=1,
+                user_id=User.query.filter_by(email=credentials["email"])
+                .one()
+                .id,
+            ),
+        )
+        db.session.commit()
+        # Start from a fresh session, as a new request would
+        db.session.remove()
+
+        test_client.post("/login", data=credentials)
+        statements.clear()
+        response = test_client.get("/results/1/demographics")
+        assert response.status_code == 200
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record)
+
+    # The only look at the study's users is the EXISTS check
+    membership_checks = [
+        statement
+        for statement in statements
+        if "accessible_studies" in statement
+    ]
+    assert membership_checks
+    assert all("EXISTS" in statement for statement in membership_checks)
+
+
+@pytest.mark.parametrize(
+    ("checked", "expected"),
+    [
+        (
+            {
+                "included_patients": ["1.2"],
+                "excluded_patients": ["2.1", "2.2"],
+            },
+            {("1.2", True), ("2.1", False), ("2.2", False)},
+        ),
+        (
+            {
+                "included_patients": ["1.1", "1.2"],
+                "excluded_patients": ["2.2"],
+            },
+            {("1.1", True), ("1.2", True), ("2.2", False)},
+        ),
+        ({}, set()),
+        ({"newly_included": "1.1"}, {("1.1", True)}),
+    ],
+)
+def test_study_config_drops_unchecked_patients(
+    test_client,
+    example_study,
+    login_admin,
+    checked,
+    expected,
+):
+    """Test that unchecked explicit patients are deleted on save."""
+    db.session.add_all(
+        [
+            ExplicitPatient(study_id=1, study_instance_uid=uid, included=inc)
+            for uid, inc in [
+                ("1.1", True),
+                ("1.2", True),
+                ("2.1", False),
+                ("2.2", False),
+            ]
+        ],
+    )
+    db.session.commit()
+
+    response = test_client.post(
+        "/results/1/config",
+        data={
+            "pi_name": "TestPi",
+            "project_name": "MyStudy",
+            "dataset_name": "MyStudy",
+            "heuristic": "cfmm_base.py",
+            **checked,
+        },
+    )
+
+    assert response.status_code == 200
+    assert {
+        (patient.study_instance_uid, patient.included)
+        for patient in ExplicitPatient.query.all()
+    } == expected
+
+
 def test_admin_index(test_client, login_admin):
     """Test that the admin index lists users."""
     response = test_client.get("/admin")
@@ -423,3 +574,27 @@ def test_admin_user(test_client, login_admin):
 #    assert response.status_code == 200
 #    assert b"4MR1" in response.data
 #    assert b"CompressedSamples^MR1" in response.data
+
+
+@pytest.mark.parametrize("config_overrides", [{"SLOW_QUERY_THRESHOLD": 0}])
+def test_slow_query_logging(test_client, init_database, caplog):
+    """Test that queries over SLOW_QUERY_THRESHOLD are logged."""
+    response = test_client.post(
+        "/login",
+        data={"email": "nobody@example.com", "password": "password"},
+    )
+
+    assert response.status_code == 302
+    assert "Slow query" in caplog.text
+    assert "FROM user" in caplog.text
+
+
+def test_principal_names_follow_refresh(fake_redis, init_database):
+    """Test that cached PI names are reloaded once check_pis bumps them."""
+    assert get_principal_names() == ("Apple",)
+    Principal.query.update({"principal_name": "Banana"})
+    db.session.commit()
+    assert get_principal_names() == ("Apple",)
+
+    fake_redis.incr(PRINCIPAL_VERSION_KEY)
+    assert get_principal_names() == ("Banana",)
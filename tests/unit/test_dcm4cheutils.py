@@ -0,0 +1,55 @@
+"""Unit tests of the dcm4che utilities."""
+
+import pytest
+
+from autobidsportal.dcm4cheutils import (
+    Dcm4cheError,
+    normalize_output_fields,
+    parse_findscu_file,
+)
+
+FINDSCU_XML = (
+    "<NativeDicomModel>"
+    '<DicomAttribute tag="00100010" vr="PN" keyword="PatientName">'
+    '<PersonName number="1"><Alphabetic><FamilyName>Doe^John</FamilyName>'
+    "</Alphabetic></PersonName></DicomAttribute>"
+    '<DicomAttribute tag="0020000D" vr="UI" keyword="StudyInstanceUID">'
+    '<Value number="1">1.2.3.4</Value></DicomAttribute>'
+    '<DicomAttribute tag="00100040" vr="CS" keyword="PatientSex">'
+    "</DicomAttribute>"
+    "</NativeDicomModel>"
+)
+
+
+def test_normalize_output_fields():
+    """Test that hex tags are upper-cased and keywords are left alone."""
+    assert normalize_output_fields(["0020000d", "PatientName"]) == [
+        "0020000D",
+        "PatientName",
+    ]
+
+
+@pytest.fixture()
+def findscu_file(tmp_path):
+    """Write the example findscu output to a file."""
+    path = tmp_path / "000.xml"
+    path.write_text(FINDSCU_XML)
+    return path
+
+
+def test_parse_findscu_file(findscu_file):
+    """Test that fields are found by tag or keyword."""
+    assert parse_findscu_file(
+        findscu_file,
+        ["0020000D", "PatientName", "PatientSex"],
+    ) == {
+        "StudyInstanceUID": "1.2.3.4",
+        "PatientName": "Doe^John",
+        "PatientSex": "",
+    }
+
+
+def test_parse_findscu_file_missing_field(findscu_file):
+    """Test that a missing field raises an error."""
+    with pytest.raises(Dcm4cheError):
+        parse_findscu_file(findscu_file, ["SeriesDescription"])
@@ -0,0 +1,137 @@
+"""Unit tests of the DICOM record helpers."""
+
+import pytest
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from autobidsportal import dicom
+from autobidsportal.dcm4cheutils import DicomQueryAttributes
+from autobidsportal.dicom import (
+    clear_cached_responses,
+    organize_flat_responses,
+    organize_inclusion_responses,
+    query_series,
+)
+
+
+class FakeUtils:
+    """Stand-in for Dcm4cheUtils that records the queries it's sent."""
+
+    def __init__(self):
+        self.queries = []
+
+    def query_single_study(self, _attributes, query, retrieve_level):
+        self.queries.append(query)
+        return [{"StudyDescription": query.study_description}]
+
+    def query_many_studies(self, _attributes, queries, retrieve_level):
+        self.queries.extend(queries)
+        return [[{"StudyDescription": q.study_description}] for q in queries]
+
+
+class BrokenRedis:
+    """Redis connection that always fails."""
+
+    def __getattr__(self, _name):
+        def fail(*_args, **_kwargs):
+            raise RedisConnectionError
+
+        return fail
+
+
+@pytest.fixture()
+def fake_utils(monkeypatch):
+    utils = FakeUtils()
+    monkeypatch.setattr(dicom, "gen_utils", lambda: utils)
+    return utils
+
+
+def _queries(*descriptions):
+    return [
+        DicomQueryAttributes(study_description=description)
+        for description in descriptions
+    ]
+
+
+def test_query_series_cache(fake_redis, fake_utils):
+    """Test that cached responses are reused and only misses are queried."""
+    assert query_series(_queries("A^1")) == [[{"StudyDescription": "A^1"}]]
+    assert query_series(_queries("B^2", "A^1", "C^3")) == [
+        [{"StudyDescription": "B^2"}],
+        [{"StudyDescription": "A^1"}],
+        [{"StudyDescription": "C^3"}],
+    ]
+    assert [q.study_description for q in fake_utils.queries] == [
+        "A^1",
+        "B^2",
+        "C^3",
+    ]
+
+    query_series(_queries("A^1", "B^2", "C^3"))
+    assert len(fake_utils.queries) == 3
+
+    clear_cached_responses()
+    assert fake_redis.data == {}
+    query_series(_queries("A^1"))
+    assert len(fake_utils.queries) == 4
+
+
+def test_query_series_without_redis(test_client, fake_utils):
+    """Test that the server is queried directly if redis is unavailable."""
+    test_client.application.redis = BrokenRedis()
+
+    for _ in range(2):
+        assert query_series(_queries("A^1")) == [
+            [{"StudyDescription": "A^1"}],
+        ]
+    clear_cached_responses()
+    assert len(fake_utils.queries) == 2
+
+
+def test_organize_flat_responses():
+    """Test that series are grouped by study and sorted numerically."""
+    responses = [
+        {
+            "StudyInstanceUID": uid,
+            "SeriesNumber": number,
+            "SeriesDescription": f"series {number}",
+        }
+        for uid, number in [("1.1", "10"), ("1.2", "1"), ("1.1", "9")]
+    ]
+    patient_info = {
+        "1.1": ("id1", "Doe^John", "M", "study1"),
+        "1.2": ("id2", "Doe^Jane", "F", "study2"),
+    }
+
+    records = sorted(
+        organize_flat_responses(responses, patient_info),
+        key=lambda record: record["StudyInstanceUID"],
+    )
+
+    assert [record["PatientID"] for record in records] == ["id1", "id2"]
+    assert records[0]["series"] == [
+        {"SeriesNumber": "9", "SeriesDescription": "series 9"},
+        {"SeriesNumber": "10", "SeriesDescription": "series 10"},
+    ]
+    assert records[1]["series"] == [
+        {"SeriesNumber": "1", "SeriesDescription": "series 1"},
+    ]
+
+
+def test_organize_inclusion_responses_keeps_first_series():
+    """Test that a study's patient info comes from its first series."""
+    responses = [
+        {
+            "StudyInstanceUID": "1.1",
+            "SeriesNumber": number,
+            "SeriesDescription": f"series {number}",
+            "PatientID": patient_id,
+            "PatientName": "Doe^John",
+            "PatientSex": "M",
+            "StudyID": "study1",
+        }
+        for number, patient_id in [("1", "first"), ("2", "second")]
+    ]
+
+    records = organize_inclusion_responses(responses)
+
+    assert [record["PatientID"] for record in records] == ["first"]
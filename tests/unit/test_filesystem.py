@@ -0,0 +1,65 @@
+"""Unit tests of the filesystem utilities."""
+
+from autobidsportal.filesystem import gen_dir_dict, render_dir_dict
+
+
+def test_gen_dir_dict(tmp_path):
+    """Test that a nested tree is converted, skipping ignored names."""
+    (tmp_path / "sub-01" / "anat").mkdir(parents=True)
+    (tmp_path / "sub-01" / "anat" / "sub-01_T1w.nii.gz").touch()
+    (tmp_path / "dataset_description.json").touch()
+    (tmp_path / ".git").mkdir()
+    (tmp_path / ".git" / "HEAD").touch()
+
+    dir_dict = gen_dir_dict(tmp_path, frozenset({".git"}))
+
+    assert dir_dict == {
+        "files": ["dataset_description.json"],
+        "dirs": {
+            "sub-01": {
+                "files": [],
+                "dirs": {
+                    "anat": {"files": ["sub-01_T1w.nii.gz"], "dirs": {}},
+                },
+            },
+        },
+    }
+    assert list(render_dir_dict(dir_dict)) == [
+        "├── dataset_description.json",
+        "└── sub-01",
+        "    └── anat",
+        "        └── sub-01_T1w.nii.gz",
+    ]
+
+
+def test_gen_dir_dict_parallel(tmp_path):
+    """Test that walking subdirectories concurrently gives the same tree."""
+    for subject in ("01", "02", "03"):
+        (tmp_path / f"sub-{subject}" / "anat").mkdir(parents=True)
+        (tmp_path / f"sub-{subject}" / "anat" / "T1w.nii.gz").touch()
+
+    assert gen_dir_dict(tmp_path, max_workers=2) == gen_dir_dict(
+        tmp_path,
+        max_workers=1,
+    )
+    assert sorted(gen_dir_dict(tmp_path, max_workers=2)["dirs"]) == [
+        "sub-01",
+        "sub-02",
+        "sub-03",
+    ]
+
+
+def test_gen_dir_dict_symlinks(tmp_path):
+    """Test that symlinks are listed as files and followed into dirs."""
+    (tmp_path / "data").mkdir()
+    (tmp_path / "data" / "file.txt").touch()
+    (tmp_path / "linked_dir").symlink_to(tmp_path / "data")
+    (tmp_path / "linked_file").symlink_to(tmp_path / "missing")
+
+    dir_dict = gen_dir_dict(tmp_path)
+
+    assert sorted(dir_dict["files"]) == ["linked_dir", "linked_file"]
+    assert dir_dict["dirs"] == {
+        "data": {"files": ["file.txt"], "dirs": {}},
+        "linked_dir": {"files": ["file.txt"], "dirs": {}},
+    }
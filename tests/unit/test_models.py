@@ -1,7 +1,20 @@
 """Unit tests of the database models."""
 
 import datetime
-from autobidsportal.models import User, Study
+from autobidsportal.models import Study, Task, User, db
+
+
+class FakeQueue:
+    """Stand-in for an rq queue that records the jobs it's given."""
+
+    def __init__(self):
+        self.enqueued = []
+
+    def prepare_data(self, func, **kwargs):
+        return func, kwargs
+
+    def enqueue_many(self, job_datas):
+        self.enqueued.extend(job_datas)
 
 
 def test_new_user():
@@ -93,4 +106,46 @@ def test_new_study():
         "",
         datetime.datetime(2021, 1, 1, 10, 10, 10, 100000),
     )
-    assert study.__repr__() == f"<Answer {studys}>"
+    assert study.dump() == f"<Answer {studys}>"
+    assert study.__repr__() == "<Study None 'Autobids'>"
+
+
+def test_launch_study_tasks(test_client, example_study):
+    """Test that one task is recorded and enqueued per study."""
+    study = db.session.get(Study, 1)
+    db.session.add(
+        Study(
+            **{
+                column.key: getattr(study, column.key)
+                for column in Study.__table__.columns
+                if column.key != "id"
+            }
+        )
+    )
+    db.session.commit()
+    queue = FakeQueue()
+    test_client.application.task_queue = queue
+
+    job_ids = Task.launch_study_tasks(
+        "archive_raw_data",
+        "Archive raw data",
+        [1, 2],
+        timeout=500,
+    )
+
+    tasks = {task.id: task for task in Task.query.all()}
+    assert sorted(tasks) == sorted(job_ids)
+    assert [tasks[job_id].study_id for job_id in job_ids] == [1, 2]
+    assert all(
+        task.name == "archive_raw_data"
+        and task.description == "Archive raw data"
+        and not task.complete
+        for task in tasks.values()
+    )
+    assert queue.enqueued == [
+        (
+            "autobidsportal.tasks.archive_raw_data",
+            {"args": (study_id,), "timeout": 500, "job_id": job_id},
+        )
+        for job_id, study_id in zip(job_ids, [1, 2])
+    ]